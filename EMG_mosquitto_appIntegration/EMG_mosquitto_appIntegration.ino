@@ -49,6 +49,31 @@ unsigned long startMillis;
 #define I2C_SDA 21 
 #define I2C_SCL 22 
 
+// Payload format: 0 = JSON (one sample per publish), 1 = compact binary frames
+// (layout documented in emg_engine/protocol.py, decoded by the Python backend)
+#define BINARY_PAYLOAD 0
+#define SAMPLES_PER_PUBLISH 1   // binary mode only: samples batched into one frame
+
+struct __attribute__((packed)) FrameHeader {
+  char magic[2];
+  uint8_t version;
+  uint8_t flags;
+  uint16_t device_id;
+  uint32_t seq;
+  uint16_t count;
+};
+
+struct __attribute__((packed)) SampleRecord {
+  uint32_t time;
+  uint16_t emg1;
+  uint16_t emg2;
+  float imu[6];
+};
+
+uint8_t frameBuffer[sizeof(FrameHeader) + SAMPLES_PER_PUBLISH * sizeof(SampleRecord)];
+uint16_t framedSamples = 0;
+uint32_t sampleSeq = 0;
+
 void loadConfiguration() {
   preferences.begin("wifi-config", true);
   String savedSSID = preferences.getString("ssid", "");
@@ -146,6 +171,9 @@ void startDataMode() {
   // Only proceed with MQTT setup if WiFi connected successfully
   if (WiFi.status() == WL_CONNECTED) {
       client.setServer(config.mqtt_server, config.mqtt_port);
+#if BINARY_PAYLOAD
+      client.setBufferSize(sizeof(frameBuffer) + 64);
+#endif
       startMillis = millis();
       Serial.println("Data mode initialized");
   }
@@ -383,6 +411,38 @@ void loop() {
     float gyro_y = g.gyro.y;
     float gyro_z = g.gyro.z;
 
+#if BINARY_PAYLOAD
+    SampleRecord *record = (SampleRecord *)(frameBuffer + sizeof(FrameHeader)) + framedSamples;
+    record->time = millis() - startMillis;
+    record->emg1 = emg1;
+    record->emg2 = emg2;
+    record->imu[0] = acc_x;
+    record->imu[1] = acc_y;
+    record->imu[2] = acc_z;
+    record->imu[3] = gyro_x;
+    record->imu[4] = gyro_y;
+    record->imu[5] = gyro_z;
+    framedSamples++;
+
+    if (framedSamples == SAMPLES_PER_PUBLISH) {
+      FrameHeader *header = (FrameHeader *)frameBuffer;
+      header->magic[0] = 'E';
+      header->magic[1] = 'M';
+      header->version = 1;
+      header->flags = 0;
+      header->device_id = (uint16_t)(ESP.getEfuseMac() >> 32);  // last two MAC bytes
+      header->seq = sampleSeq;
+      header->count = framedSamples;
+
+      if (client.connected()){
+        client.publish("esp32/emg", frameBuffer, sizeof(frameBuffer));
+      } else {
+        Serial.printf("Failed to send data to MQTT broker. ");
+      }
+      sampleSeq += framedSamples;
+      framedSamples = 0;
+    }
+#else
     StaticJsonDocument<512> doc;
     JsonObject value = doc.createNestedObject("value");
     value["time"] = millis() - startMillis;
@@ -404,6 +464,7 @@ void loop() {
     } else {
       Serial.printf("Failed to send data to MQTT broker. ");
     }
+#endif
     Serial.printf("EMG1: %d | EMG2: %d\n", emg1, emg2);
     delay(100);
   }
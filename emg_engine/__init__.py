@@ -0,0 +1 @@
+"""Shared signal-processing engine for the EMG sign language translator backend."""
@@ -0,0 +1,105 @@
+"""Rest gating, so samples where the hand is still skip features and inference."""
+import math
+
+
+class RestGate:
+    """Per-sample wake/sleep decision from EMG energy and IMU motion.
+
+    EMG energy is the largest RMS, over about ``fast_ms``, of each EMG
+    channel around its resting level. Motion is the deviation of the
+    accelerometer magnitude from gravity plus the gyro magnitude, averaged
+    the same way. Both are compared with noise-floor baselines that drop
+    quickly but rise only at rest, over ``baseline_ms``; the gate wakes
+    when either exceeds ``factor`` times its baseline (and at least its
+    floor) and sleeps ``hold_ms`` after both have dropped back. The gate
+    stays open for the first ``warmup_ms`` while the levels settle. Every
+    step is a few float operations on a single sample.
+
+    ``pre_roll_ms`` is how much signal from just before the wake-up the
+    first window is rebuilt from, so the onset is not lost; the Pipeline
+    never rebuilds less than a full sub-window.
+    """
+
+    def __init__(self, emg_channels=(0, 1), acc_channels=(2, 3, 4), gyro_channels=(5, 6, 7),
+                 fast_ms=50, baseline_ms=5000, emg_factor=3.0, motion_factor=3.0,
+                 emg_floor=20.0, motion_floor=0.3, hold_ms=500, pre_roll_ms=250, warmup_ms=1000):
+        self.emg_channels = tuple(emg_channels)
+        self.acc_channels = tuple(acc_channels)
+        self.gyro_channels = tuple(gyro_channels)
+        self.fast_ms = fast_ms
+        self.baseline_ms = baseline_ms
+        self.emg_factor = emg_factor
+        self.motion_factor = motion_factor
+        self.emg_floor = emg_floor
+        self.motion_floor = motion_floor
+        self.hold_ms = hold_ms
+        self.pre_roll_ms = pre_roll_ms
+        self.warmup_ms = warmup_ms
+        self.reset()
+
+    def reset(self):
+        self.awake = True
+        self.emg = self.motion = 0.0
+        self.emg_baseline = self.motion_baseline = None
+        self._rest_level = [None] * len(self.emg_channels)
+        self._power = [0.0] * len(self.emg_channels)
+        self._gravity = None
+        self._first = self._last = self._last_active = None
+
+    def _follow(self, baseline, value, fall, rise, warming_up):
+        if value < baseline:
+            return baseline + fall * (value - baseline)
+        if warming_up or not self.awake:
+            return baseline + rise * (value - baseline)
+        return baseline
+
+    def update(self, timestamp, values):
+        """Feed one sample's eight channels; returns True while the pipeline should run."""
+        if self._last is not None and timestamp < self._last:
+            self.reset()  # device restarted
+        dt = 0.0 if self._last is None else timestamp - self._last
+        # Python floats: much cheaper than NumPy scalars for a handful of values
+        values = values.tolist() if hasattr(values, "tolist") else values
+        if self._first is None:
+            self._first = timestamp
+        self._last = timestamp
+        warming_up = timestamp - self._first < self.warmup_ms
+        fast = 1.0 - math.exp(-dt / self.fast_ms)
+        settle = 1.0 - math.exp(-dt / (self.fast_ms * 4))
+        slow = 1.0 - math.exp(-dt / self.baseline_ms)
+        # Resting levels settle during the warm-up, then drift slowly
+        level = settle if warming_up else slow
+
+        energy = 0.0
+        for i, channel in enumerate(self.emg_channels):
+            x = values[channel]
+            if self._rest_level[i] is None:
+                self._rest_level[i] = x
+            else:
+                self._rest_level[i] += level * (x - self._rest_level[i])
+            deviation = x - self._rest_level[i]
+            self._power[i] += fast * (deviation * deviation - self._power[i])
+            energy = max(energy, self._power[i])
+        self.emg = math.sqrt(energy)
+
+        acc = math.sqrt(sum(values[c] * values[c] for c in self.acc_channels))
+        gyro = math.sqrt(sum(values[c] * values[c] for c in self.gyro_channels))
+        if self._gravity is None:
+            self._gravity = acc
+        # |acc| does not depend on orientation, so gravity can be tracked all the time
+        self._gravity += level * (acc - self._gravity)
+        self.motion += fast * (abs(acc - self._gravity) + gyro - self.motion)
+
+        if self.emg_baseline is None:
+            self.emg_baseline, self.motion_baseline = self.emg, self.motion
+        else:
+            rise = settle if warming_up else slow
+            self.emg_baseline = self._follow(self.emg_baseline, self.emg, settle, rise, warming_up)
+            self.motion_baseline = self._follow(self.motion_baseline, self.motion, settle, rise, warming_up)
+
+        if (warming_up
+                or self.emg > max(self.emg_baseline * self.emg_factor, self.emg_floor)
+                or self.motion > max(self.motion_baseline * self.motion_factor, self.motion_floor)):
+            self._last_active = timestamp
+        self.awake = self._last_active is not None and timestamp - self._last_active <= self.hold_ms
+        return self.awake
@@ -0,0 +1,275 @@
+"""Inference backends for the gesture classifier.
+
+Every backend exposes ``classes_`` and ``predict_proba(X)`` like a fitted
+scikit-learn classifier, so Pipeline and the batch helpers accept any of
+them in place of the unpickled model.
+
+    python -m emg_engine.backends model.pkl --flat model_flat --onnx model.onnx --recording session.npz
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+# What load_backend accepts as ``kind``
+BACKEND_KINDS = ("auto", "sklearn", "flat", "onnx")
+
+
+def file_stamp(path):
+    """Absolute path, size and mtime: enough to notice a retrained model replacing a file."""
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class SklearnBackend:
+    """A fitted scikit-learn classifier, used as-is."""
+
+    def __init__(self, model):
+        self.model = model
+        self.classes_ = model.classes_
+        self.n_features = model.n_features_in_
+
+    def predict_proba(self, X):
+        return self.model.predict_proba(X)
+
+
+class FlatForestBackend:
+    """A RandomForestClassifier flattened into contiguous arrays.
+
+    The nodes of all trees are concatenated; leaves point back to themselves
+    so every tree can be stepped ``max_depth`` times in lockstep. Each step
+    is a handful of ``np.take`` calls over all (row, tree) pairs at once,
+    which avoids sklearn's input validation and per-tree Python dispatch.
+    """
+
+    ARRAYS = ("feature", "threshold", "children", "value", "roots")
+
+    def __init__(self, feature, threshold, children, value, roots, classes, n_features, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.classes_ = np.asarray(classes)
+        self.n_features = n_features
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_sklearn(cls, model):
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            ids = np.arange(n)
+            leaf = tree.children_left < 0
+            left = np.where(leaf, ids, tree.children_left) + offset
+            right = np.where(leaf, ids, tree.children_right) + offset
+            features.append(np.where(leaf, 0, tree.feature))
+            # Leaves compare against +inf and always "go left" to themselves
+            thresholds.append(np.where(leaf, np.inf, tree.threshold))
+            children.append(np.column_stack([left, right]))
+            value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(value / normalizer)
+            roots.append(offset)
+            offset += n
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children=np.concatenate(children).astype(np.intp).ravel(),
+            value=np.concatenate(values),
+            roots=np.array(roots, dtype=np.intp),
+            classes=model.classes_,
+            n_features=model.n_features_in_,
+            max_depth=max(e.tree_.max_depth for e in model.estimators_),
+        )
+
+    def predict_proba(self, X):
+        # sklearn evaluates trees on float32 inputs; match it for identical splits
+        X = np.ascontiguousarray(X, dtype=np.float32).reshape(-1, self.n_features)
+        flat_x = X.astype(np.float64).ravel()
+        n_rows, n_trees = len(X), len(self.roots)
+        node = np.broadcast_to(self.roots, (n_rows, n_trees)).copy()
+        child = np.empty_like(node)
+        row_offset = (np.arange(n_rows) * self.n_features)[:, None] if n_rows > 1 else None
+        for _ in range(self.max_depth):
+            feature = np.take(self.feature, node)
+            if row_offset is not None:
+                feature += row_offset
+            go_right = np.take(flat_x, feature) > np.take(self.threshold, node)
+            np.add(node, node, out=child)
+            child += go_right
+            np.take(self.children, child, out=node)
+        proba = np.take(self.value, node, axis=0).sum(axis=1)
+        return proba / n_trees
+
+    def save(self, path, source=None):
+        """Write one uncompressed .npy per array plus a small JSON header.
+
+        ``source`` is the pickle the forest was flattened from; its stamp
+        goes in the header so ``is_current`` can tell when it changes.
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        meta = {"classes": self.classes_.tolist(), "n_features": self.n_features,
+                "max_depth": self.max_depth, "source": file_stamp(source) if source else None}
+        with open(os.path.join(path, "forest.json"), "w") as f:
+            json.dump(meta, f)
+        return path
+
+    @staticmethod
+    def is_current(path, source):
+        """True if ``path`` holds a forest saved from ``source`` as it is now (or ``source`` is gone)."""
+        try:
+            with open(os.path.join(path, "forest.json")) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return False
+        if not os.path.exists(source):
+            return True
+        return meta.get("source") == file_stamp(source)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        with open(os.path.join(path, "forest.json")) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in cls.ARRAYS}
+        return cls(classes=meta["classes"], n_features=meta["n_features"],
+                   max_depth=meta["max_depth"], **arrays)
+
+
+class OnnxBackend:
+    """The forest exported to ONNX and run with onnxruntime on the CPU.
+
+    Needs the optional ``onnxruntime`` package (and ``skl2onnx`` to export).
+    """
+
+    def __init__(self, model_bytes, classes):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("OnnxBackend needs onnxruntime: pip install onnxruntime") from None
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_bytes, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.classes_ = np.asarray(classes)
+        self.n_features = self.session.get_inputs()[0].shape[1]
+
+    @staticmethod
+    def export(model, path):
+        try:
+            from skl2onnx import to_onnx
+        except ImportError:
+            raise ImportError("Exporting to ONNX needs skl2onnx: pip install skl2onnx") from None
+        sample = np.zeros((1, model.n_features_in_), dtype=np.float32)
+        onnx_model = to_onnx(model, sample, options={id(model): {"zipmap": False}})
+        with open(path, "wb") as f:
+            f.write(onnx_model.SerializeToString())
+        with open(path + ".classes.json", "w") as f:
+            json.dump(model.classes_.tolist(), f)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path + ".classes.json") as f:
+            classes = json.load(f)
+        with open(path, "rb") as f:
+            return cls(f.read(), classes)
+
+    def predict_proba(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32).reshape(-1, self.n_features)
+        return self.session.run(None, {self.input_name: X})[1]
+
+
+def load_backend(path, kind="auto", mmap_mode=None):
+    """Load a model file as a backend.
+
+    ``kind`` is "sklearn" (pickled estimator), "flat" (flattens a pickled
+    forest, or loads a directory written by FlatForestBackend.save), "onnx",
+    or "auto" to decide from the path.
+    """
+    if kind not in BACKEND_KINDS:
+        raise ValueError(f"Unknown backend {kind!r}, expected one of {', '.join(BACKEND_KINDS)}")
+    if kind == "auto":
+        if os.path.isdir(path):
+            kind = "flat"
+        elif path.endswith(".onnx"):
+            kind = "onnx"
+        else:
+            kind = "sklearn"
+    if kind == "onnx":
+        return OnnxBackend.load(path)
+    if kind == "flat" and os.path.isdir(path):
+        return FlatForestBackend.load(path, mmap_mode=mmap_mode)
+
+    import joblib
+    model = joblib.load(path)
+    if kind == "flat":
+        return FlatForestBackend.from_sklearn(model)
+    return SklearnBackend(model)
+
+
+def parity_check(reference, candidate, X):
+    """Compare two backends on the same feature rows."""
+    expected = reference.predict_proba(X)
+    got = candidate.predict_proba(X)
+    return {
+        "rows": len(X),
+        "max_abs_diff": float(np.max(np.abs(expected - got))) if len(X) else 0.0,
+        "label_agreement": float(np.mean(np.argmax(expected, 1) == np.argmax(got, 1))) if len(X) else 1.0,
+    }
+
+
+def single_row_latency(backend, X, repeat=200):
+    """Median seconds for one single-row predict_proba call."""
+    timings = []
+    for i in range(repeat):
+        row = X[i % len(X)].reshape(1, -1)
+        started = time.perf_counter()
+        backend.predict_proba(row)
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings))
+
+
+def main(argv=None):
+    import argparse
+
+    from .batch import window_features_batch
+    from .recording import load_recording, synthetic_recording
+
+    parser = argparse.ArgumentParser(description="Export a pickled forest and check parity.")
+    parser.add_argument("model", help="pickled RandomForestClassifier")
+    parser.add_argument("--flat", help="write the flattened forest to this directory")
+    parser.add_argument("--onnx", help="also export an ONNX model to this file")
+    parser.add_argument("--recording", help="recorded session for the parity check (default: synthetic)")
+    args = parser.parse_args(argv)
+
+    reference = load_backend(args.model, "sklearn")
+    candidates = {"flat": FlatForestBackend.from_sklearn(reference.model)}
+    if args.flat:
+        candidates["flat"].save(args.flat, source=args.model)
+    if args.onnx:
+        OnnxBackend.export(reference.model, args.onnx)
+        candidates["onnx"] = OnnxBackend.load(args.onnx)
+
+    recording = load_recording(args.recording) if args.recording else synthetic_recording(60)
+    _, X = window_features_batch(recording.samples[:, 0], recording.samples[:, 1:], 500, 250)
+    if X.shape[1] != reference.n_features:
+        # e.g. the single-channel model: score the first channel's features
+        X = X[:, :reference.n_features]
+
+    print(f"sklearn  single-row {single_row_latency(reference, X) * 1e6:9.1f} us")
+    for name, backend in candidates.items():
+        result = parity_check(reference, backend, X)
+        print(f"{name:<8} single-row {single_row_latency(backend, X) * 1e6:9.1f} us  "
+              f"max |dp| {result['max_abs_diff']:.2e}  label agreement {result['label_agreement']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
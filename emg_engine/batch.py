@@ -0,0 +1,77 @@
+import numpy as np
+
+from .features import FEATURES
+
+
+def window_starts(times, window_ms, step_ms):
+    """Start times of every full window, stepping from the first sample."""
+    if len(times) == 0 or times[-1] - times[0] < window_ms:
+        return np.empty(0)
+    count = int(np.floor((times[-1] - times[0] - window_ms) / step_ms)) + 1
+    return times[0] + step_ms * np.arange(count)
+
+
+def _cumsum(a):
+    out = np.zeros((len(a) + 1,) + a.shape[1:], dtype=a.dtype)
+    np.cumsum(a, axis=0, out=out[1:])
+    return out
+
+
+def window_features_batch(times, values, window_ms, step_ms, features=FEATURES):
+    """Feature rows for every ``[start, start + window_ms)`` sub-window at once.
+
+    ``times`` must be sorted. Per-sample terms are accumulated once with
+    cumulative sums and every window is a difference of two prefix sums, so
+    the cost is O(samples + windows) instead of one pass per window. Returns
+    ``(starts, X)`` for the non-empty windows, with ``X`` laid out like
+    ``extract_features`` rows.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    x = np.asarray(values, dtype=np.float64)
+    starts = window_starts(times, window_ms, step_ms)
+    lo = np.searchsorted(times, starts, side="left")
+    hi = np.searchsorted(times, starts + window_ms, side="left")
+    keep = hi > lo
+    starts, lo, hi = starts[keep], lo[keep], hi[keep]
+    if len(starts) == 0:
+        return starts, np.empty((0, x.shape[1] * len(features)), dtype=np.float32)
+
+    n = (hi - lo)[:, None]
+    absx = np.abs(x)
+    # Variance is shift-invariant; centring keeps the prefix sums small
+    centred = x - x.mean(axis=0)
+    c_abs = _cumsum(absx)
+    c_sq = _cumsum(np.square(x))
+    c_sum = _cumsum(centred)
+    c_csq = _cumsum(np.square(centred))
+    # Pair terms: pair i joins samples i and i + 1, so a window owns pairs lo..hi-2
+    c_wl = _cumsum(np.abs(np.diff(x, axis=0)))
+    c_zc = _cumsum((np.diff(np.sign(x), axis=0) != 0).astype(np.int64))
+
+    sum_abs = c_abs[hi] - c_abs[lo]
+    mean_c = (c_sum[hi] - c_sum[lo]) / n
+    computed = {
+        "mav": lambda: sum_abs / n,
+        "rms": lambda: np.sqrt(np.maximum(c_sq[hi] - c_sq[lo], 0.0) / n),
+        "var": lambda: np.maximum((c_csq[hi] - c_csq[lo]) / n - np.square(mean_c), 0.0),
+        "zc": lambda: c_zc[hi - 1] - c_zc[lo],
+        "wl": lambda: c_wl[hi - 1] - c_wl[lo],
+        "iemg": lambda: sum_abs,
+    }
+    out = np.empty((len(starts), x.shape[1], len(features)), dtype=np.float32)
+    for j, name in enumerate(features):
+        out[:, :, j] = computed[name]()
+    return starts, out.reshape(len(starts), -1)
+
+
+def predict_windows(model, times, values, window_ms, step_ms, features=FEATURES):
+    """Score every sub-window of a recording with a single ``predict_proba`` call.
+
+    Returns ``(starts, labels, confidences)`` for the non-empty windows.
+    """
+    starts, X = window_features_batch(times, values, window_ms, step_ms, features)
+    if len(X) == 0:
+        return starts, np.empty(0, dtype=object), np.empty(0)
+    probs = model.predict_proba(X)
+    best = np.argmax(probs, axis=1)
+    return starts, model.classes_[best], probs[np.arange(len(best)), best]
@@ -0,0 +1,239 @@
+"""Throughput and latency benchmark for the sample pipeline, no broker needed.
+
+    python -m emg_engine.bench --seconds 60 --devices 4 --format binary
+    python -m emg_engine.bench --recording session.npz --model model.pkl --memory
+
+Every engine replays the same session through parse -> window -> features
+-> predict -> publish and reports samples/sec plus per-stage latency
+percentiles. ``list`` is the original final_app.py hot path (list rebuild,
+DataFrame features, CSV payloads) kept here as the baseline.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from collections import defaultdict
+
+import numpy as np
+
+from .batch import window_features_batch
+from .pipeline import Pipeline, Prediction
+from .recording import encode_messages, load_recording, replay, synthetic_recording
+from .scheduler import BatchScheduler
+from .sessions import DeviceSession, SessionManager, device_id_from_topic
+
+ENGINES = ("list", "ring", "incremental")
+STAGES = ("parse", "buffer", "features", "batch_wait", "predict", "publish")
+SENSORS = ["emg1", "emg2", "accx", "accy", "accz", "gyrox", "gyroy", "gyroz"]
+
+
+class StageTimings:
+    """Collects raw per-stage durations for percentile reporting."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def record(self, stage, seconds):
+        self.samples[stage].append(seconds)
+
+    def percentiles(self, q=(50, 95, 99)):
+        """{stage: [p50, p95, p99]} in microseconds."""
+        return {stage: list(np.percentile(values, q) * 1e6)
+                for stage, values in self.samples.items() if values}
+
+
+class LegacyPipeline:
+    """The original final_app.py on_message path, per device, for comparison.
+
+    Its sub-window kept the sample exactly ``sub_window_ms`` old;
+    ``half_open`` drops it, as the engine and training do.
+    """
+
+    def __init__(self, model, main_window_ms, sub_window_ms, predict_interval_ms,
+                 on_prediction=None, base_topic="esp32/emg", timings=None, min_confidence=0.4,
+                 half_open=False):
+        import pandas as pd
+        self.pd = pd
+        self.model = model
+        self.main_window_ms = main_window_ms
+        self.sub_window_ms = sub_window_ms
+        self.predict_interval_ms = predict_interval_ms
+        self.on_prediction = on_prediction
+        self.base_topic = base_topic
+        self.timings = timings
+        self.min_confidence = min_confidence
+        self.half_open = half_open
+        self.buffers = {}
+        self.last_prediction_time = {}
+
+    def _record(self, stage, started):
+        if self.timings is not None:
+            self.timings.record(stage, time.perf_counter() - started)
+
+    def feature_extraction(self, df_window):
+        feats = {}
+        for s in SENSORS:
+            data = df_window[s].values
+            if len(data) == 0:
+                continue
+            feats[f"{s}_mav"] = np.mean(np.abs(data))
+            feats[f"{s}_rms"] = np.sqrt(np.mean(np.square(data)))
+            feats[f"{s}_var"] = np.var(data)
+            feats[f"{s}_zc"] = np.sum(np.diff(np.sign(data)) != 0)
+            feats[f"{s}_wl"] = np.sum(np.abs(np.diff(data)))
+            feats[f"{s}_iemg"] = np.sum(np.abs(data))
+        return self.pd.DataFrame([feats])
+
+    def handle_message(self, topic, payload):
+        started = time.perf_counter()
+        payload = payload.decode().strip()
+        payload = payload.replace("{", "").replace("}", "")
+        values = [float(x) for x in payload.split(",")]
+        device_id = device_id_from_topic(topic, self.base_topic)
+        self._record("parse", started)
+        if len(values) != 9 or device_id is None:
+            return
+
+        started = time.perf_counter()
+        timestamp = values[0]
+        buffer = self.buffers.get(device_id, [])
+        buffer.append(values)
+        min_time = timestamp - self.main_window_ms
+        buffer = self.buffers[device_id] = [row for row in buffer if row[0] >= min_time]
+        self._record("buffer", started)
+
+        if timestamp - self.last_prediction_time.get(device_id, 0) < self.predict_interval_ms:
+            return
+
+        started = time.perf_counter()
+        df = self.pd.DataFrame(buffer, columns=["time"] + SENSORS)
+        cut = timestamp - self.sub_window_ms
+        df_window = df[df["time"] > cut] if self.half_open else df[df["time"] >= cut]
+        feats = self.feature_extraction(df_window)
+        self._record("features", started)
+
+        started = time.perf_counter()
+        probs = self.model.predict_proba(feats.to_numpy())[0]
+        self._record("predict", started)
+
+        best = int(np.argmax(probs))
+        label = self.model.classes_[best] if probs[best] >= self.min_confidence else None
+        if self.on_prediction is not None:
+            started = time.perf_counter()
+            self.on_prediction(Prediction(device_id, timestamp, label, float(probs[best])))
+            self._record("publish", started)
+        self.last_prediction_time[device_id] = timestamp
+
+
+def synthetic_model(recording, n_estimators=100, seed=0):
+    """A forest with the production feature layout, fitted on synthetic windows."""
+    from sklearn.ensemble import RandomForestClassifier
+    first = recording.device == 0
+    _, X = window_features_batch(recording.samples[first, 0], recording.samples[first, 1:], 500, 250)
+    labels = np.random.default_rng(seed).choice(["help", "thank", "welcome"], len(X))
+    return RandomForestClassifier(n_estimators=n_estimators, random_state=seed).fit(X, labels)
+
+
+def serialize_prediction(prediction):
+    """Stand-in for the WebSocket publish: the JSON the apps broadcast."""
+    if prediction.label is not None:
+        json.dumps({"predicted_label": str(prediction.label), "device_id": prediction.device_id})
+
+
+def build_engine(engine, model, args, timings=None):
+    if engine == "list":
+        return LegacyPipeline(model, args.main_window_ms, args.sub_window_ms, args.interval_ms,
+                              on_prediction=serialize_prediction, timings=timings)
+    incremental = engine == "incremental"
+    sessions = SessionManager(
+        lambda device_id: DeviceSession(device_id, args.main_window_ms, args.sub_window_ms,
+                                        len(SENSORS), incremental=incremental),
+        max_sessions=max(64, args.devices))
+    scheduler = None
+    if args.batch_ms is not None:
+        scheduler = BatchScheduler(args.max_batch, args.batch_ms, timings)
+    return Pipeline(model, sessions, on_prediction=serialize_prediction,
+                    predict_interval_ms=args.interval_ms, timings=timings, scheduler=scheduler)
+
+
+def run_engine(engine, model, recording, args):
+    fmt = "csv" if engine == "list" else args.format
+    messages = encode_messages(recording, fmt)
+    timings = StageTimings()
+    pipeline = build_engine(engine, model, args, timings)
+    elapsed = replay(messages, pipeline.handle_message, speed=args.speed)
+    scheduler = getattr(pipeline, "scheduler", None)
+    if scheduler is not None:
+        pipeline.flush()
+    result = {
+        "engine": engine,
+        "format": fmt,
+        "samples": len(messages),
+        "samples_per_s": len(messages) / elapsed,
+        "stages": timings.percentiles(),
+    }
+    if scheduler is not None:
+        result["mean_batch"] = scheduler.mean_batch()
+    if args.memory:
+        pipeline = build_engine(engine, model, args)
+        tracemalloc.start()
+        replay(messages, pipeline.handle_message, speed=None)
+        result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return result
+
+
+def print_report(results):
+    for r in results:
+        line = f"{r['engine']:<12} {r['format']:<7} {r['samples']:>8} samples  {r['samples_per_s']:>10.0f} samples/s"
+        if "peak_mb" in r:
+            line += f"  peak {r['peak_mb']:.1f} MB"
+        if "mean_batch" in r:
+            line += f"  mean batch {r['mean_batch']:.1f}"
+        print(line)
+        for stage in STAGES:
+            if stage in r["stages"]:
+                p50, p95, p99 = r["stages"][stage]
+                print(f"    {stage:<9} p50 {p50:>9.1f} us   p95 {p95:>9.1f} us   p99 {p99:>9.1f} us")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recording", help="recorded .npz session (default: synthetic)")
+    parser.add_argument("--model", help="joblib model file (default: synthetic forest)")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=ENGINES)
+    parser.add_argument("--format", default="binary", choices=("binary", "json", "csv"))
+    parser.add_argument("--seconds", type=float, default=30, help="synthetic session length")
+    parser.add_argument("--rate", type=float, default=100, help="synthetic sample rate (Hz)")
+    parser.add_argument("--devices", type=int, default=1, help="synthetic glove count")
+    parser.add_argument("--speed", type=float, default=None, help="replay speed factor (default: max)")
+    parser.add_argument("--main-window-ms", type=float, default=4000)
+    parser.add_argument("--sub-window-ms", type=float, default=500)
+    parser.add_argument("--interval-ms", type=float, default=250, help="prediction interval")
+    parser.add_argument("--batch-ms", type=float, default=None, help="micro-batch deadline (default: no batching)")
+    parser.add_argument("--max-batch", type=int, default=32, help="micro-batch size limit")
+    parser.add_argument("--memory", action="store_true", help="also measure peak memory (slow)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.recording:
+        recording = load_recording(args.recording)
+        args.devices = len(recording.devices)
+    else:
+        recording = synthetic_recording(args.seconds, args.rate, args.devices)
+    if args.model:
+        import joblib
+        model = joblib.load(args.model)
+    else:
+        model = synthetic_model(recording)
+
+    results = [run_engine(engine, model, recording, args) for engine in args.engines]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""WebSocket fan-out with one small bounded queue per client.
+
+Everything here runs on the event loop thread; other threads hand
+messages over with ``loop.call_soon_threadsafe(broadcaster.publish, ...)``.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+class ClientQueue:
+    """Pending messages for one connection, drained by its own sender task.
+
+    Messages published with a ``key`` (e.g. the device id of a prediction)
+    replace any undelivered message with the same key, so a slow client
+    only ever gets the latest value. Unkeyed messages queue up to
+    ``maxsize``; past that the oldest pending message is dropped.
+    """
+
+    def __init__(self, websocket, devices=None, send=None, maxsize=8):
+        self.websocket = websocket
+        self.devices = devices
+        self.send = send or websocket.send
+        self.maxsize = maxsize
+        self.pending = OrderedDict()
+        self.sending = False
+        self.last_progress = time.monotonic()
+        self.coalesced = 0
+        self.dropped = 0
+        self.closing = False
+        self._ready = asyncio.Event()
+        self._next_id = 0
+        self.task = None
+
+    def wants(self, device_id):
+        return self.devices is None or device_id in self.devices
+
+    def put(self, message, key=None, received_at=None):
+        if not self.pending and not self.sending:
+            self.last_progress = time.monotonic()
+        if key is None:
+            key = self._next_id = self._next_id + 1
+        elif key in self.pending:
+            # Latest value wins, but keep the slot's place in line
+            self.coalesced += 1
+            self.pending[key] = (message, received_at, time.perf_counter())
+            return
+        if len(self.pending) >= self.maxsize:
+            self.pending.popitem(last=False)
+            self.dropped += 1
+        self.pending[key] = (message, received_at, time.perf_counter())
+        self._ready.set()
+
+    def stalled(self, now, timeout_s):
+        """True when messages have waited on this client for longer than ``timeout_s``."""
+        return (self.sending or bool(self.pending)) and now - self.last_progress > timeout_s
+
+    async def run(self, metrics=None):
+        """Send pending messages until the connection fails or is closed."""
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while self.pending:
+                _, (message, received_at, enqueued_at) = self.pending.popitem(last=False)
+                sending = time.perf_counter()
+                self.sending = True
+                await self.send(message)
+                self.sending = False
+                self.last_progress = time.monotonic()
+                if metrics is not None:
+                    sent = time.perf_counter()
+                    metrics.record("ws_queue", sending - enqueued_at)
+                    metrics.record("ws_send", sent - sending)
+                    if received_at is not None:
+                        metrics.record("end_to_end", sent - received_at)
+
+
+class Broadcaster:
+    """Routes messages to subscribed clients without letting one slow client hold up the rest.
+
+    Each client gets a ClientQueue and its own sender task. A client whose
+    queue has made no progress for ``stall_timeout_s`` is disconnected the
+    next time a message is published to it.
+    """
+
+    def __init__(self, maxsize=8, stall_timeout_s=5.0, metrics=None):
+        self.maxsize = maxsize
+        self.stall_timeout_s = stall_timeout_s
+        self.metrics = metrics
+        self.clients = {}
+
+    def __len__(self):
+        return len(self.clients)
+
+    def register(self, websocket, devices=None, send=None):
+        client = ClientQueue(websocket, devices, send, self.maxsize)
+        client.task = asyncio.ensure_future(self._run(client))
+        self.clients[websocket] = client
+        return client
+
+    def unregister(self, websocket):
+        client = self.clients.pop(websocket, None)
+        if client is not None and client.task is not None:
+            client.task.cancel()
+        return client
+
+    def subscribe(self, websocket, devices):
+        """Change which devices a client receives; None means all of them."""
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.devices = devices
+
+    def publish(self, device_id, message, key=None, received_at=None):
+        """Queue ``message`` for every client subscribed to ``device_id``."""
+        now = time.monotonic()
+        for client in list(self.clients.values()):
+            if not client.wants(device_id):
+                continue
+            if client.stalled(now, self.stall_timeout_s):
+                self.disconnect(client, "stalled")
+                continue
+            client.put(message, key, received_at)
+
+    def send(self, websocket, message, key=None):
+        """Queue ``message`` for one client only, e.g. its telemetry; False if it is gone or stalled."""
+        client = self.clients.get(websocket)
+        if client is None:
+            return False
+        if client.stalled(time.monotonic(), self.stall_timeout_s):
+            self.disconnect(client, "stalled")
+            return False
+        client.put(message, key)
+        return True
+
+    def disconnect(self, client, reason):
+        if client.closing:
+            return
+        client.closing = True
+        log.warning("Disconnecting client: %s (%d pending)", reason, len(client.pending))
+        if self.metrics is not None:
+            self.metrics.inc("dropped_clients")
+        self.unregister(client.websocket)
+        # 1013 "try again later"; close() may itself block on a dead peer
+        asyncio.ensure_future(client.websocket.close(code=1013))
+
+    async def _run(self, client):
+        try:
+            await client.run(self.metrics)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.info("Send failed, dropping client: %s", e)
+            if self.metrics is not None:
+                self.metrics.inc("dropped_clients")
+            self.clients.pop(client.websocket, None)
+
+    def stats(self):
+        clients = list(self.clients.values())
+        return {
+            "clients": len(clients),
+            "pending": sum(len(c.pending) for c in clients),
+            "coalesced": sum(c.coalesced for c in clients),
+            "dropped": sum(c.dropped for c in clients),
+        }
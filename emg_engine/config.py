@@ -0,0 +1,176 @@
+"""Settings for the translator server, as named profiles.
+
+    EMG_PROFILE=single python final_app.py
+    EMG_CONFIG=site.json EMG_MQTT_BROKER=10.0.0.5 python final_app.py
+
+``DEFAULTS`` are the 8-channel glove app (final_app.py). A profile
+overrides some of them: ``single`` is the one-channel sensor that
+websocket_page/app.py serves. On top of the profile come the settings in
+a JSON file (``EMG_CONFIG``, e.g. ``{"MQTT_BROKER": "10.0.0.5"}``), then
+``EMG_<SETTING>`` environment variables, read as JSON when they parse
+(``EMG_SMOOTHING=null``, ``EMG_SENSORS='["emg"]'``) and as plain strings
+otherwise. Relative paths are relative to the working directory, except
+``STATIC_DIR``, which is relative to the repository root.
+"""
+import json
+import os
+
+from .activity import RestGate
+from .backends import BACKEND_KINDS
+from .features import FEATURES
+from .pipeline import Pipeline
+from .protocol import decode_payload, decode_value
+from .resample import StreamResampler
+from .scheduler import BatchScheduler
+from .sessions import DeviceSession, SessionManager
+from .smoothing import GestureSegmenter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAYLOADS = {"samples": decode_payload, "value": decode_value}
+GLOVE_SENSORS = ["emg1", "emg2", "accx", "accy", "accz", "gyrox", "gyroy", "gyroz"]
+
+DEFAULTS = {
+    "PORT": 8000,
+    "WS_PORT": 8765,
+    "UNIFIED_SERVER": True,        # serve HTTP, /ws and MQTT from one event loop on PORT; False runs the old threads + WS_PORT
+    "STATIC_DIR": os.path.join("websocket_page", "static"),  # index.html and the page's assets
+    "MQTT_BROKER": "localhost",    # Mosquitto; set EMG_MQTT_BROKER (or MQTT_BROKER in EMG_CONFIG) for one on another host
+    "MQTT_PORT": 1883,
+    "TOPIC": "esp32/emg",          # gloves may also publish on TOPIC/<device_id>
+    "PAYLOAD": "samples",          # "samples": binary frames, JSON or CSV rows with device time; "value": {"value": x}, timed on arrival
+    "SENSORS": GLOVE_SENSORS,      # channel names, in payload order
+    "FEATURES": list(FEATURES),    # per-channel feature order the model was trained with
+    "MAIN_WINDOW_MS": 4000,        # 4-second buffer
+    "SUB_WINDOW_MS": 500,          # 500 ms subwindow
+    "OVERLAP_MS": 250,             # 250 ms overlap
+    "PREDICT_INTERVAL_MS": None,   # None predicts every OVERLAP_MS; 0 runs a prediction on every sample
+    "MIN_WINDOW_SAMPLES": 1,       # samples the subwindow needs before it is classified
+    "MIN_CONFIDENCE": 0.4,         # best class probability below which a window is "not recognized"
+    "SAMPLE_RATE": 100,            # grid the device streams are resampled onto, samples per second
+    "RESAMPLE": True,              # put samples on the SAMPLE_RATE grid, so every window holds the same count
+    "MAX_GAP_MS": 200,             # longer gaps restart the windows instead of being interpolated over
+    "MAX_SAMPLE_RATE": 1000,       # sizes the preallocated window buffer when not resampling
+    "INCREMENTAL_FEATURES": False, # keep sub-window features as prefix sums; pays off when windows are scored every few samples
+    "REST_GATING": True,           # skip features and inference while EMG and IMU sit at their resting baselines
+    "PRE_ROLL_MS": 250,            # signal from before a wake-up that the first window is rebuilt from, at least SUB_WINDOW_MS
+    "SMOOTHING": "ema",            # "ema" or "vote" over recent windows to publish one event per gesture; None publishes every window
+    "GESTURE_ENTER": 0.6,          # smoothed probability that starts a gesture
+    "GESTURE_EXIT": 0.4,           # ...and the level it must fall under to end it
+    "GESTURE_MAX_MS": 3000,        # a gesture held longer is published again
+    "SAMPLE_QUEUE_SIZE": 1024,     # samples waiting for the inference worker
+    "QUEUE_POLICY": "drop_oldest", # or "drop_newest" / "block" (backpressure onto the broker; also pauses the unified event loop)
+    "INFERENCE_WORKERS": 1,        # >1 shards gloves across that many processes, fed through shared memory
+    "POOL_RING_SIZE": 8192,        # samples buffered per inference process
+    "BATCH_DEADLINE_MS": 10,       # hold due windows up to this long to score many gloves in one model call; None scores each at once
+    "MAX_BATCH": 32,               # ...or until this many are waiting
+    "IDLE_SESSION_S": 60,          # forget a glove after this long without samples
+    "MAX_SESSIONS": 64,            # upper bound on concurrently tracked gloves
+    "MODEL_PATH": os.path.join(ROOT, "websocket_page", "random_forest_model_windows.pkl"),
+    "FLAT_MODEL_PATH": "auto",     # memory-mapped forest, written on first load and when MODEL_PATH changes; "auto" keeps it in .model_cache, None disables it
+    "MODEL_BACKEND": "flat",       # "flat": the forest as flattened arrays, "sklearn": the pickle as-is, "onnx": MODEL_PATH is an exported .onnx, "auto": by the path
+    "LOG_LEVEL": "INFO",           # DEBUG also logs every send and low-confidence window
+    "CLIENT_QUEUE_SIZE": 8,        # undelivered messages kept per WebSocket client
+    "CLIENT_STALL_S": 5,           # disconnect clients that accept nothing for this long
+    "TELEMETRY_TICK_MS": 50,       # binary telemetry (raw, confidences, features) is batched this often; clients pick a lower rate
+    "RECORD_PATH": None,           # e.g. "session.npz" to record raw samples for replay/benchmarks
+    "STORE_DIR": None,             # e.g. "sessions" to keep every sample and prediction on disk, per device
+    "STORE_ROLL_MB": 64,           # start a new store segment after this many MB of samples...
+    "STORE_ROLL_S": 3600,          # ...or this many seconds
+}
+
+PROFILES = {
+    "glove": {},
+    # The single-channel sensor: one reading per message and no device
+    # clock, classified over the whole 3.5 s window on every sample
+    "single": {
+        "PAYLOAD": "value",
+        "SENSORS": ["emg"],
+        "FEATURES": ["mav", "rms", "zc", "wl", "var", "iemg"],
+        "MAIN_WINDOW_MS": 3500,
+        "SUB_WINDOW_MS": 3500,
+        "PREDICT_INTERVAL_MS": 0,
+        "INCREMENTAL_FEATURES": True,
+        "MIN_WINDOW_SAMPLES": 2,
+        "MIN_CONFIDENCE": 0.0,
+        "RESAMPLE": False,
+        "REST_GATING": False,
+        "SMOOTHING": None,
+        "BATCH_DEADLINE_MS": None,
+        "MODEL_PATH": os.path.join(ROOT, "websocket_page", "random_forest_model.pkl"),
+    },
+}
+
+
+def _parse(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def load_config(profile="glove", path=None, environ=None):
+    """Resolve the settings: defaults, then the profile, the JSON file and the environment.
+
+    ``EMG_PROFILE`` and ``EMG_CONFIG`` in the environment take precedence
+    over ``profile`` and ``path``. Returns a dict of upper-case settings
+    plus ``PROFILE``; raises ValueError on an unknown profile or setting.
+    """
+    environ = os.environ if environ is None else environ
+    profile = environ.get("EMG_PROFILE", profile)
+    path = environ.get("EMG_CONFIG", path)
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown profile {profile!r}, expected one of {sorted(PROFILES)}")
+    config = dict(DEFAULTS, **PROFILES[profile])
+
+    if path:
+        with open(path) as f:
+            overrides = json.load(f)
+        unknown = sorted(set(overrides) - set(DEFAULTS))
+        if unknown:
+            raise ValueError(f"Unknown settings in {path}: {', '.join(unknown)}")
+        config.update(overrides)
+    for name in DEFAULTS:
+        if f"EMG_{name}" in environ:
+            config[name] = _parse(environ[f"EMG_{name}"])
+
+    if config["PREDICT_INTERVAL_MS"] is None:
+        config["PREDICT_INTERVAL_MS"] = config["OVERLAP_MS"]
+    if config["FLAT_MODEL_PATH"] == "auto":
+        name = os.path.splitext(os.path.basename(config["MODEL_PATH"]))[0]
+        config["FLAT_MODEL_PATH"] = os.path.join(ROOT, ".model_cache", name + "_flat")
+    if config["MODEL_BACKEND"] not in BACKEND_KINDS:
+        raise ValueError(f"Unknown MODEL_BACKEND {config['MODEL_BACKEND']!r}, expected one of {list(BACKEND_KINDS)}")
+    if config["PAYLOAD"] not in PAYLOADS:
+        raise ValueError(f"Unknown PAYLOAD {config['PAYLOAD']!r}, expected one of {sorted(PAYLOADS)}")
+    if len(config["SENSORS"]) != len(GLOVE_SENSORS):
+        # The rest detector, the recorder and the store assume the glove's channel layout
+        for name in ("REST_GATING", "RECORD_PATH", "STORE_DIR"):
+            if config[name]:
+                raise ValueError(f"{name} needs the 8-channel glove layout")
+    config["PROFILE"] = profile
+    return config
+
+
+def build_pipeline(config, on_prediction=None, on_gesture=None, timings=None):
+    """The inference pipeline for these settings; one per inference process."""
+    c = config
+    n_channels = len(c["SENSORS"])
+    sessions = SessionManager(
+        lambda device_id: DeviceSession(device_id, c["MAIN_WINDOW_MS"], c["SUB_WINDOW_MS"], n_channels,
+                                        c["SAMPLE_RATE"] if c["RESAMPLE"] else c["MAX_SAMPLE_RATE"],
+                                        incremental=c["INCREMENTAL_FEATURES"], features=c["FEATURES"],
+                                        min_samples=c["MIN_WINDOW_SAMPLES"]),
+        idle_timeout_s=c["IDLE_SESSION_S"], max_sessions=c["MAX_SESSIONS"])
+    return Pipeline(None, sessions, on_prediction=on_prediction, base_topic=c["TOPIC"],
+                    predict_interval_ms=c["PREDICT_INTERVAL_MS"], min_confidence=c["MIN_CONFIDENCE"],
+                    timings=timings,
+                    activity=(lambda: RestGate(pre_roll_ms=c["PRE_ROLL_MS"])) if c["REST_GATING"] else None,
+                    segmenter=(lambda: GestureSegmenter(c["SMOOTHING"], enter=c["GESTURE_ENTER"],
+                                                         exit=c["GESTURE_EXIT"],
+                                                         max_duration_ms=c["GESTURE_MAX_MS"]))
+                              if c["SMOOTHING"] is not None else None,
+                    on_gesture=on_gesture,
+                    resample=(lambda: StreamResampler(c["SAMPLE_RATE"], c["MAX_GAP_MS"])) if c["RESAMPLE"] else None,
+                    scheduler=BatchScheduler(c["MAX_BATCH"], c["BATCH_DEADLINE_MS"], timings)
+                              if c["BATCH_DEADLINE_MS"] is not None else None,
+                    decode=PAYLOADS[c["PAYLOAD"]])
@@ -0,0 +1,34 @@
+import numpy as np
+
+# Per-sensor feature order used when the models were trained
+FEATURES = ("mav", "rms", "var", "zc", "wl", "iemg")
+
+
+def feature_names(sensors, features=FEATURES):
+    """Column names in the order ``extract_features`` lays them out."""
+    return [f"{s}_{f}" for s in sensors for f in features]
+
+
+def extract_features(window, features=FEATURES):
+    """Compute the training features for every channel of a window at once.
+
+    ``window`` is an ``(n_samples, n_channels)`` array. Returns a flat float32
+    vector grouped per channel (``ch0_mav, ch0_rms, ..., ch1_mav, ...``), the
+    same layout ``feature_extraction`` produced through a DataFrame. Samples
+    are upcast to float64 and reduced along contiguous rows so each value is
+    bit-identical to the per-sensor NumPy calls it replaces.
+    """
+    x = np.ascontiguousarray(np.asarray(window).T, dtype=np.float64)
+    absx = np.abs(x)
+    computed = {
+        "mav": lambda: np.mean(absx, axis=1),
+        "rms": lambda: np.sqrt(np.mean(np.square(x), axis=1)),
+        "var": lambda: np.var(x, axis=1),
+        "zc": lambda: np.sum(np.diff(np.sign(x), axis=1) != 0, axis=1),
+        "wl": lambda: np.sum(np.abs(np.diff(x, axis=1)), axis=1),
+        "iemg": lambda: np.sum(absx, axis=1),
+    }
+    out = np.empty((x.shape[0], len(features)), dtype=np.float32)
+    for j, name in enumerate(features):
+        out[:, j] = computed[name]()
+    return out.ravel()
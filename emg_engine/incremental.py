@@ -0,0 +1,160 @@
+import numpy as np
+
+from .features import FEATURES, extract_features
+from .ring_buffer import SampleRingBuffer
+
+# Per-sample terms, each n_channels wide: x, |x|, x^2, then the pair terms
+# |x - prev| and sign change, which belong to the later sample of a pair
+N_TERMS = 5
+
+
+class IncrementalFeatures:
+    """Sliding-window features kept as prefix sums.
+
+    ``update`` only appends the sample to the ring. When the features are
+    read, the samples added since then get their terms' running totals
+    appended to a second ring, in one vectorised step, and the samples that
+    fell out of the ``window_ms`` window are dropped from both. The window's
+    sums are then the newest total minus the one just before the window, so
+    a read costs O(samples since the last read) however long the window is.
+    ``snapshot`` returns the same layout as ``extract_features``. The totals
+    are rebuilt from the window every ``recompute_every`` samples so they
+    never grow large enough to lose precision. ``capacity`` bounds the
+    samples in the window; the rings hold twice that, so up to a window's
+    worth can wait for the next read.
+    """
+
+    def __init__(self, window_ms, n_channels=8, capacity=4096, features=FEATURES,
+                 recompute_every=1000):
+        self.window_ms = window_ms
+        self.features = tuple(features)
+        self.recompute_every = recompute_every
+        self.buffer = SampleRingBuffer(2 * capacity, n_channels)
+        # One row per summed sample, plus the base row just before the window
+        self._totals = SampleRingBuffer(2 * capacity + 1, N_TERMS * n_channels, dtype=np.float64)
+        self.reset()
+
+    def __len__(self):
+        """Samples in the window."""
+        self._fold()
+        return len(self.buffer)
+
+    def reset(self):
+        self.buffer.clear()
+        self._totals.clear()
+        self._totals.append(-np.inf, 0.0)
+        self._updates = 0
+        self._pending = 0  # newest samples without a totals row yet
+
+    def update(self, timestamp, values):
+        """Add one sample; the totals catch up on the next read."""
+        buf = self.buffer
+        if len(buf) and timestamp < buf.newest_time:
+            # Device clock went backwards, nothing in the window is valid
+            self.reset()
+        elif len(buf) == buf.capacity:
+            self._fold()
+            if len(buf) == buf.capacity:
+                self._drop(1)
+        buf.append(timestamp, values)
+        self._pending += 1
+
+    def _fold(self):
+        """Append totals rows for the pending samples, then drop the expired ones."""
+        if not self._pending:
+            return  # the window only moves when samples arrive
+        self._updates += self._pending
+        if self._updates >= self.recompute_every:
+            self.resync()
+            return
+        self._append_totals(self._pending)
+        # The window is (newest - window_ms, newest], see SampleRingBuffer
+        buf = self.buffer
+        expired = buf.count_through(buf.newest_time - self.window_ms)
+        if expired:
+            self._drop(expired)
+
+    def _append_totals(self, count):
+        # Read back from the buffer, so the totals see the float32 rounding
+        # the windows hold; the newest summed sample pairs with the first new one
+        times, rows = self.buffer.last(count + 1)
+        rows = rows.astype(np.float64)
+        if len(rows) == count:
+            # The window starts here: the first sample has no pair
+            rows = np.concatenate((rows[:1], rows))
+            times = times[-count:]
+        else:
+            times = times[1:]
+        x, prev = rows[1:], rows[:-1]
+        terms = np.empty((count, N_TERMS, x.shape[1]))
+        terms[:, 0] = x
+        np.abs(x, out=terms[:, 1])
+        np.square(x, out=terms[:, 2])
+        np.abs(x - prev, out=terms[:, 3])
+        terms[:, 4] = np.sign(x) != np.sign(prev)
+        totals = np.cumsum(terms.reshape(count, -1), axis=0)
+        totals += self._totals.last(1)[1][0]
+        if count == 1:
+            self._totals.append(times[0], totals[0])
+        else:
+            self._totals.extend(times, totals)
+        self._pending = 0
+
+    def _drop(self, count):
+        self.buffer.drop(count)
+        self._totals.drop(count)
+
+    def load(self, times, values):
+        """Replace the window with the given samples (oldest first) and rebuild the totals."""
+        self.reset()
+        self.buffer.extend(times, values)
+        self.resync()
+
+    def resync(self):
+        """Rebuild the totals from the buffered window, starting from zero."""
+        self.buffer.evict_window(self.window_ms)
+        self._totals.clear()
+        self._totals.append(-np.inf, 0.0)
+        self._updates = 0
+        self._pending = 0
+        if len(self.buffer):
+            self._append_totals(len(self.buffer))
+
+    def _sums(self):
+        """Window sums of the per-sample terms, as ``(N_TERMS, n_channels)``."""
+        totals = self._totals.last(len(self.buffer) + 1)[1]
+        sums = totals[-1] - totals[0]
+        # Pair terms: the oldest sample's pair reaches outside the window
+        split = 3 * self.buffer.n_channels
+        sums[split:] -= totals[1, split:] - totals[0, split:]
+        return sums.reshape(N_TERMS, -1)
+
+    def snapshot(self):
+        """Current window features as a flat float32 vector, or None when empty."""
+        self._fold()
+        n = len(self.buffer)
+        if n == 0:
+            return None
+        total, total_abs, total_sq, wl, zc = self._sums()
+        mean = total / n
+        mean_sq = np.maximum(total_sq, 0.0) / n
+        computed = {
+            "mav": total_abs / n,
+            "rms": np.sqrt(mean_sq),
+            "var": np.maximum(mean_sq - np.square(mean), 0.0),
+            "zc": np.round(zc),
+            "wl": wl,
+            "iemg": total_abs,
+        }
+        out = np.empty((len(mean), len(self.features)), dtype=np.float32)
+        for j, name in enumerate(self.features):
+            out[:, j] = computed[name]
+        return out.ravel()
+
+    def exact(self):
+        """Features recomputed from scratch over the window, for drift checks."""
+        self._fold()
+        _, window = self.buffer.window()
+        if len(window) == 0:
+            return None
+        return extract_features(window, self.features)
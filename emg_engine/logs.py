@@ -0,0 +1,40 @@
+import logging
+import time
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets each message template through at most ``burst`` times per ``interval_s``.
+
+    Suppressed records are counted and reported on the next record that gets
+    through, so floods (e.g. one log line per prediction) cost almost nothing.
+    """
+
+    def __init__(self, interval_s=5.0, burst=5):
+        super().__init__()
+        self.interval_s = interval_s
+        self.burst = burst
+        self._windows = {}
+
+    def filter(self, record):
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        started, passed, suppressed = self._windows.get(key, (now, 0, 0))
+        if now - started >= self.interval_s:
+            started, passed = now, 0
+        if passed >= self.burst:
+            self._windows[key] = (started, passed, suppressed + 1)
+            return False
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        self._windows[key] = (started, passed + 1, 0)
+        return True
+
+
+def setup_logging(level=logging.INFO, interval_s=5.0, burst=5):
+    """Leveled console logging with per-message rate limiting."""
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s"))
+    handler.addFilter(RateLimitFilter(interval_s, burst))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
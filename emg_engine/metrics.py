@@ -0,0 +1,93 @@
+import threading
+import time
+
+import numpy as np
+
+
+class Histogram:
+    """Latency histogram over the most recent ``size`` observations.
+
+    Recording is a single array write; percentiles are only computed when a
+    snapshot is taken.
+    """
+
+    def __init__(self, size=4096):
+        self._values = np.zeros(size)
+        self._next = 0
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds):
+        self._values[self._next] = seconds
+        self._next = (self._next + 1) % len(self._values)
+        self.count += 1
+        self.total += seconds
+
+    def summary(self):
+        """Counts plus mean/p50/p95/p99/max in milliseconds."""
+        recent = self._values[:min(self.count, len(self._values))]
+        if len(recent) == 0:
+            return {"count": 0}
+        p50, p95, p99 = np.percentile(recent, (50, 95, 99)) * 1e3
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1e3,
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "p99_ms": p99,
+            "max_ms": recent.max() * 1e3,
+        }
+
+
+class Metrics:
+    """Stage histograms, counters and gauges shared by the whole backend.
+
+    ``record(stage, seconds)`` matches the timings hook of Pipeline, so the
+    registry can be passed to it directly.
+    """
+
+    def __init__(self, histogram_size=4096):
+        self.histogram_size = histogram_size
+        self.started = time.time()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, Histogram(self.histogram_size))
+        histogram.record(seconds)
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def gauge(self, name, fn):
+        """Register a callable sampled every time a snapshot is taken."""
+        self._gauges[name] = fn
+
+    def counter(self, name):
+        return self._counters.get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+        gauges = {}
+        for name, fn in self._gauges.items():
+            try:
+                gauges[name] = fn()
+            except Exception as e:
+                gauges[name] = f"error: {e}"
+        return {
+            "uptime_s": time.time() - self.started,
+            "stages": {stage: h.summary() for stage, h in sorted(histograms.items())},
+            "counters": counters,
+            "gauges": gauges,
+        }
+
+
+METRICS = Metrics()
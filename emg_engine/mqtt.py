@@ -0,0 +1,84 @@
+"""Run a paho MQTT client on an asyncio event loop instead of its own thread."""
+import asyncio
+import logging
+import threading
+
+import paho.mqtt.client as mqtt
+
+log = logging.getLogger(__name__)
+
+
+class AsyncioMqtt:
+    """Drives ``client`` from the running event loop.
+
+    The client's socket is watched with ``loop.add_reader``/``add_writer``,
+    so ``on_connect``/``on_message`` are called on the loop thread. Keepalive
+    pings run from ``run()``, which also reconnects with backoff until
+    ``stop()`` is awaited.
+    """
+
+    def __init__(self, client, max_backoff_s=30.0):
+        self.client = client
+        self.max_backoff_s = max_backoff_s
+        self.loop = None
+        self._thread_id = None
+        self._stopping = False
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    # paho calls these from whichever thread touches the socket. connect()
+    # runs in an executor, so run() registers the new socket itself once it
+    # returns; everything after that happens on the loop thread.
+    def _on_loop(self):
+        return self._thread_id == threading.get_ident()
+
+    def _on_socket_open(self, client, userdata, sock):
+        if self._on_loop():
+            self.loop.add_reader(sock, client.loop_read)
+
+    def _on_socket_close(self, client, userdata, sock):
+        if self._on_loop():
+            self.loop.remove_reader(sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        if self._on_loop():
+            self.loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        if self._on_loop():
+            self.loop.remove_writer(sock)
+
+    async def run(self, host, port=1883, keepalive=60):
+        """Connect and stay connected until stop() is called."""
+        self.loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        backoff = 1.0
+        while not self._stopping:
+            try:
+                # The TCP connect blocks; keep it off the loop
+                await self.loop.run_in_executor(None, self.client.connect, host, port, keepalive)
+            except OSError as e:
+                log.warning("MQTT connection to %s failed: %s (retrying in %.0fs)", host, e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff_s)
+                continue
+            backoff = 1.0
+            sock = self.client.socket()
+            self.loop.add_reader(sock, self.client.loop_read)
+            if self.client.want_write():
+                self.loop.add_writer(sock, self.client.loop_write)
+            while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+                await asyncio.sleep(1)
+            if not self._stopping:
+                log.warning("MQTT connection lost, reconnecting")
+
+    async def stop(self, timeout_s=2.0):
+        """Disconnect cleanly and wait for the socket to close."""
+        self._stopping = True
+        if self.client.is_connected():
+            self.client.disconnect()
+            deadline = self.loop.time() + timeout_s
+            while self.client.socket() is not None and self.loop.time() < deadline:
+                await asyncio.sleep(0.05)
@@ -0,0 +1,172 @@
+"""Check the engine against the code the apps ran before they moved onto it.
+
+    python -m emg_engine.parity
+    python -m emg_engine.parity --profile single --model websocket_page/random_forest_model.pkl
+
+``single`` replays a session through LegacySingleChannel, the original
+websocket_page/app.py feature_extraction (a list trimmed with pop(0) on
+every sample), and through the Pipeline the ``single`` profile builds.
+``glove`` compares the ``glove`` profile with bench.LegacyPipeline, the
+original final_app.py DataFrame path, with resampling, rest gating and
+smoothing off, since those change what is predicted on purpose. Both
+legacy paths are run with the engine's half-open windows,
+``(t - window, t]``: they kept a sample exactly one window old, which
+training never did. Every window must get the same label at the same
+time; the exit status is 1 when one does not.
+"""
+import argparse
+import functools
+import json
+import sys
+
+import numpy as np
+
+from .backends import FlatForestBackend
+from .bench import LegacyPipeline, synthetic_model
+from .config import build_pipeline, load_config
+from .features import extract_features
+from .protocol import decode_value, encode_csv
+from .recording import load_recording, synthetic_recording
+
+# Wall clock at the start of the replayed session, for the single-channel app's host timestamps
+EPOCH_S = 1.7e9
+
+
+class LegacySingleChannel:
+    """The original websocket_page/app.py feature_extraction, with the clock passed in.
+
+    ``half_open`` also drops the sample exactly ``window_ms`` old.
+    """
+
+    def __init__(self, model, window_ms=3500, half_open=False):
+        self.model = model
+        self.window_ms = window_ms
+        self.half_open = half_open
+        self.data_buffer = []
+        self.timestamp_buffer = []
+
+    def handle(self, data, current_time):
+        """Returns the predicted label, or None while the window holds one sample."""
+        value = float(data)
+        self.data_buffer.append(value)
+        self.timestamp_buffer.append(current_time)
+
+        while self.timestamp_buffer and (current_time - self.timestamp_buffer[0] >= self.window_ms if self.half_open
+                                         else current_time - self.timestamp_buffer[0] > self.window_ms):
+            self.data_buffer.pop(0)
+            self.timestamp_buffer.pop(0)
+
+        if len(self.data_buffer) > 1:
+            buffer = np.array(self.data_buffer)
+            features = {
+                "MAV": np.mean(np.abs(buffer)),
+                "RMS": np.sqrt(np.mean(buffer**2)),
+                "ZC": int(np.sum(np.diff(np.sign(buffer)) != 0)),
+                "WL": float(np.sum(np.abs(np.diff(buffer)))),
+                "VAR": float(np.var(buffer)),
+                "IEMG": float(np.sum(np.abs(buffer)))
+            }
+            return self.model.predict([list(features.values())])[0]
+        return None
+
+
+def _backend(model, config):
+    return FlatForestBackend.from_sklearn(model) if config["MODEL_BACKEND"] == "flat" else model
+
+
+def _load_model(path):
+    import joblib
+    return joblib.load(path)
+
+
+def _single_model(recording, features, seed=0):
+    from sklearn.ensemble import RandomForestClassifier
+    X = []
+    emg = recording.samples[:, 1:2]
+    for lo in range(0, len(emg) - 350, 25):
+        X.append(extract_features(emg[lo:lo + 350], features))
+    labels = np.random.default_rng(seed).choice(["peace", "rock", "thumbs"], len(X))
+    return RandomForestClassifier(n_estimators=50, random_state=seed).fit(np.array(X), labels)
+
+
+def compare(expected, got):
+    """``expected`` and ``got`` are ``{(device_id, timestamp): label}``; returns the mismatches."""
+    keys = sorted(set(expected) | set(got), key=lambda k: (str(k[0]), k[1]))
+    return [(key, expected.get(key, "<none>"), got.get(key, "<none>"))
+            for key in keys if expected.get(key, "<none>") != got.get(key, "<none>")]
+
+
+def check_single(model, recording, environ=None):
+    """Replay the first device's emg1 channel as ``{"value": x}`` messages timed on arrival."""
+    config = load_config("single", environ={} if environ is None else environ)
+    legacy = LegacySingleChannel(model, config["MAIN_WINDOW_MS"], half_open=True)
+    got = {}
+    pipeline = build_pipeline(config, on_prediction=lambda p: got.__setitem__((p.device_id, p.timestamp), p.label))
+    pipeline.model = _backend(model, config)
+    now = [0.0]
+    pipeline.decode = functools.partial(decode_value, clock=lambda: now[0])
+
+    expected = {}
+    first = recording.device == 0
+    for received, value in zip(recording.received[first], recording.samples[first, 1]):
+        now[0] = EPOCH_S + received
+        label = legacy.handle(value, now[0] * 1000.0)
+        if label is not None:
+            expected[("default", now[0] * 1000.0)] = label
+        pipeline.handle_message(config["TOPIC"], json.dumps({"value": value}).encode())
+    return expected, got
+
+
+def check_glove(model, recording, environ=None):
+    """Replay every device as CSV rows through both paths."""
+    config = load_config("glove", environ={} if environ is None else environ)
+    config.update(RESAMPLE=False, REST_GATING=False, SMOOTHING=None)
+    expected, got = {}, {}
+    legacy = LegacyPipeline(model, config["MAIN_WINDOW_MS"], config["SUB_WINDOW_MS"],
+                            config["PREDICT_INTERVAL_MS"], min_confidence=config["MIN_CONFIDENCE"], half_open=True,
+                            on_prediction=lambda p: expected.__setitem__((p.device_id, p.timestamp), p.label))
+    pipeline = build_pipeline(config, on_prediction=lambda p: got.__setitem__((p.device_id, p.timestamp), p.label))
+    pipeline.model = _backend(model, config)
+
+    # The gloves send float32 IMU readings and the windows keep float32 channels
+    samples = recording.samples.astype(np.float32).astype(np.float64)
+    for device, row in zip(recording.device, samples):
+        topic = f"{config['TOPIC']}/{recording.devices[device]}"
+        payload = encode_csv(row)
+        legacy.handle_message(topic, payload)
+        pipeline.handle_message(topic, payload)
+    pipeline.flush()
+    return expected, got
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", nargs="+", default=["glove", "single"], choices=("glove", "single"))
+    parser.add_argument("--model", help="pickled forest for the profile (default: fitted on the session)")
+    parser.add_argument("--recording", help="recorded .npz session (default: synthetic)")
+    parser.add_argument("--seconds", type=float, default=60, help="synthetic session length")
+    parser.add_argument("--devices", type=int, default=2, help="synthetic glove count")
+    args = parser.parse_args(argv)
+
+    recording = (load_recording(args.recording) if args.recording
+                 else synthetic_recording(args.seconds, 100, args.devices))
+    failed = False
+    for profile in args.profile:
+        if args.model:
+            model = _load_model(args.model)
+        elif profile == "glove":
+            model = synthetic_model(recording)
+        else:
+            model = _single_model(recording, load_config("single", environ={})["FEATURES"])
+        expected, got = (check_glove if profile == "glove" else check_single)(model, recording)
+        mismatches = compare(expected, got)
+        print(f"{profile:<7} {len(expected):>7} legacy predictions  {len(got):>7} engine predictions  "
+              f"{len(mismatches)} mismatches")
+        for (device_id, timestamp), want, have in mismatches[:10]:
+            print(f"        {device_id} at {timestamp:.1f} ms: legacy {want!r}, engine {have!r}")
+        failed = failed or bool(mismatches)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import logging
+import time
+from collections import Counter, namedtuple
+
+import numpy as np
+
+from .protocol import decode_payload
+from .resample import GAP, RESTART, SequenceTracker
+from .sessions import device_id_from_topic
+from .smoothing import GestureEvent
+
+log = logging.getLogger(__name__)
+
+# label is None when the best class stayed under the confidence threshold;
+# received_at is the host perf_counter() time the triggering sample arrived;
+# probs and features are the model's output and input for the window
+Prediction = namedtuple("Prediction", ["device_id", "timestamp", "label", "confidence", "received_at",
+                                       "probs", "features"],
+                        defaults=(None, None, None))
+
+
+class Pipeline:
+    """parse -> window -> features -> predict -> publish, shared by the apps and the replayer.
+
+    ``on_prediction`` is called with every Prediction made. When ``timings``
+    is given, each stage's duration is passed to ``timings.record(stage, seconds)``.
+
+    ``resample``, ``activity`` and ``segmenter`` are optional factories,
+    called once per device: a StreamResampler puts the samples on a
+    fixed-rate grid first (dropping duplicates and late samples, and
+    restarting the windows across long gaps), a RestGate decides per sample whether the hand is active, and
+    samples at rest only reach the main buffer (no features, no inference);
+    a GestureSegmenter turns the predictions into GestureEvents passed to
+    ``on_gesture``.
+    ``scheduler`` is an optional BatchScheduler shared by every device: due
+    feature rows are scored together once the batch fills or its deadline
+    passes, and whoever drives the pipeline calls ``poll()`` in between.
+    ``model`` may be None while it is still loading: samples are buffered
+    but nothing is predicted until it is set. ``decode`` turns a payload
+    into a protocol Frame (``decode_payload`` reads every glove format).
+    """
+
+    def __init__(self, model, sessions, on_prediction=None, base_topic="esp32/emg",
+                 predict_interval_ms=250, min_confidence=0.4, timings=None,
+                 activity=None, segmenter=None, on_gesture=None, resample=None, scheduler=None,
+                 decode=decode_payload):
+        self.model = model
+        self.sessions = sessions
+        self.on_prediction = on_prediction
+        self.base_topic = base_topic
+        self.predict_interval_ms = predict_interval_ms
+        self.min_confidence = min_confidence
+        self.timings = timings
+        self.activity = activity
+        self.segmenter = segmenter
+        self.on_gesture = on_gesture
+        self.resample = resample
+        self.scheduler = scheduler
+        self.decode = decode
+        self.samples_seen = 0
+        self.samples_gated = 0
+        # Resampler statuses (duplicate, out_of_order, gap, restart) and binary frame sequence gaps
+        self.stream_events = Counter()
+        self.sequence = SequenceTracker()
+
+    def stats(self):
+        """Counters behind the metrics gauges, as plain numbers (the pool sums them over workers)."""
+        stats = {"sessions": len(self.sessions), "samples_seen": self.samples_seen,
+                 "samples_gated": self.samples_gated, "seq_lost": self.sequence.lost,
+                 "seq_reordered": self.sequence.reordered}
+        stats.update((f"stream_{event}", count) for event, count in self.stream_events.items())
+        if self.scheduler is not None:
+            stats.update(batches=self.scheduler.batches, batch_rows=self.scheduler.rows,
+                         full_batches=self.scheduler.full_batches)
+        return stats
+
+    def _record(self, stage, started):
+        if self.timings is not None:
+            self.timings.record(stage, time.perf_counter() - started)
+
+    def _emit(self, device_id, segments, model):
+        if self.on_gesture is None:
+            return
+        for index, start, end, confidence in segments:
+            self.on_gesture(GestureEvent(device_id, model.classes_[index], start, end, confidence))
+
+    def parse(self, topic, payload):
+        """Decode an MQTT message into ``(device_id, rows)``; device_id is None if unroutable."""
+        started = time.perf_counter()
+        frame = self.decode(payload)
+        device_id = frame.device_id or device_id_from_topic(topic, self.base_topic)
+        if frame.seq is not None and device_id is not None:
+            lost = self.sequence.check(device_id, frame.seq, len(frame.samples))
+            if lost:
+                log.debug("Device %s skipped %d samples before seq %d", device_id, lost, frame.seq)
+        self._record("parse", started)
+        return device_id, frame.samples
+
+    def handle_message(self, topic, payload):
+        """Parse and process a message inline (no worker thread)."""
+        device_id, rows = self.parse(topic, payload)
+        if device_id is None:
+            return
+        for values in rows:
+            self.process_sample(device_id, values)
+
+    def process_sample(self, device_id, values, received_at=None):
+        """Feed one ``(time, channels...)`` row; returns a Prediction when one was made."""
+        for evicted in self.sessions.maybe_evict_idle():
+            log.info("Session %s idle, dropped", evicted)
+        if self.scheduler is not None and self.scheduler.wait_s() == 0.0:
+            self.poll()
+
+        session = self.sessions.get(device_id)
+        if self.resample is None:
+            return self._process(device_id, session, values[0], values[1:], received_at)
+
+        started = time.perf_counter()
+        if session.resampler is None:
+            session.resampler = self.resample()
+        status, times, rows = session.resampler.add(values[0], values[1:])
+        if status is not None:
+            self.stream_events[status] += 1
+            if status in (GAP, RESTART):
+                # Windows still waiting in the batch belong to the old stream: score them first
+                self.flush()
+                session.reset_windows()
+                if self.model is not None and session.segmenter is not None:
+                    self._emit(device_id, session.segmenter.rest(), self.model)
+        self._record("resample", started)
+        prediction = None
+        for timestamp, row in zip(times.tolist(), rows):
+            prediction = self._process(device_id, session, timestamp, row, received_at) or prediction
+        return prediction
+
+    def _process(self, device_id, session, timestamp, values, received_at):
+        started = time.perf_counter()
+        self.samples_seen += 1
+        was_awake = awake = True
+        if self.activity is not None:
+            if session.activity is None:
+                session.activity = self.activity()
+            was_awake = session.activity.awake
+            awake = session.activity.update(timestamp, values)
+        session.add_sample(timestamp, values, update_features=awake)
+        if awake and not was_awake:
+            # The main buffer kept the gated samples: rebuild a whole sub-window,
+            # so the onset is scored on as many samples as the model was trained on
+            session.preroll(max(session.activity.pre_roll_ms, session.sub_window_ms))
+            # Classify the onset now rather than at the next interval
+            session.last_prediction_time = timestamp - self.predict_interval_ms
+        self._record("buffer", started)
+
+        model = self.model
+        if not awake:
+            self.samples_gated += 1
+            if was_awake and model is not None and session.segmenter is not None:
+                self.flush()
+                self._emit(device_id, session.segmenter.rest(), model)
+            return None
+        if model is None or not session.prediction_due(timestamp, self.predict_interval_ms):
+            return None
+
+        started = time.perf_counter()
+        feats = session.current_features()
+        self._record("features", started)
+        if feats is None:
+            return None
+        session.last_prediction_time = timestamp
+
+        if self.scheduler is not None:
+            scored = self.scheduler.submit(feats, (device_id, session, timestamp, received_at, feats), model)
+            return self._deliver(scored, model)
+
+        started = time.perf_counter()
+        probs = model.predict_proba(feats.reshape(1, -1))[0]
+        self._record("predict", started)
+        return self._predicted(device_id, session, timestamp, received_at, feats, probs, model)
+
+    def poll(self):
+        """Score a pending batch whose deadline has passed; returns seconds until the next one is due."""
+        if self.scheduler is None:
+            return None
+        if self.model is not None:
+            self._deliver(self.scheduler.poll(self.model), self.model)
+        return self.scheduler.wait_s()
+
+    def flush(self):
+        """Score whatever is pending now, e.g. at the end of a replay."""
+        if self.scheduler is not None and self.model is not None:
+            self._deliver(self.scheduler.flush(self.model), self.model)
+
+    def _deliver(self, scored, model):
+        prediction = None
+        for (device_id, session, timestamp, received_at, feats), probs in scored:
+            prediction = self._predicted(device_id, session, timestamp, received_at, feats, probs, model)
+        return prediction
+
+    def _predicted(self, device_id, session, timestamp, received_at, feats, probs, model):
+        if self.segmenter is not None:
+            if session.segmenter is None:
+                session.segmenter = self.segmenter()
+            self._emit(device_id, session.segmenter.update(timestamp, probs), model)
+
+        best = int(np.argmax(probs))
+        confidence = float(probs[best])
+        label = model.classes_[best] if confidence >= self.min_confidence else None
+        prediction = Prediction(device_id, timestamp, label, confidence, received_at, probs, feats)
+
+        if self.on_prediction is not None:
+            started = time.perf_counter()
+            self.on_prediction(prediction)
+            self._record("publish", started)
+        return prediction
@@ -0,0 +1,419 @@
+"""Shard gloves across inference processes, fed through shared-memory rings.
+
+    python -m emg_engine.pool --workers 1 2 4 --devices 16 --seconds 30
+
+One Python process runs features and ``predict_proba`` for one device at a
+time, whatever the core count. ``InferencePool`` starts N worker
+processes, each with its own Pipeline, and sends every device to the same
+worker, so its window state stays in one place. A new device goes to the
+worker with the fewest devices; hashing the ids instead splits a handful
+of gloves unevenly (crc32 puts glove0..glove3 all on one of two workers).
+Sample blocks are copied into a per-worker ring in shared memory instead
+of being pickled, and predictions and gesture events (a few per second)
+come back on a queue and are passed to the callbacks on a thread of the
+parent process, e.g. to publish through the broadcaster. Every second each
+worker also sends its pipeline's counters and stage timings, so the
+parent can report them as if it ran the pipeline itself. A device idle
+for ``idle_timeout_s`` is forgotten on both sides: a record with a NaN
+receive time, queued behind its last samples, retires its number.
+
+Workers load the model themselves; with the flat forest memory-mapped
+read-only (``FlatForestBackend.load(path, mmap_mode="r")``), every worker
+maps the same file and the OS shares its pages.
+"""
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter
+from multiprocessing import shared_memory
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Ring record: device number, host receive time, then the (time, 8 channels) row
+ROW_WIDTH = 9
+RECORD_WIDTH = ROW_WIDTH + 2
+STATS_INTERVAL_S = 1.0
+
+
+class SharedRing:
+    """Single-producer, single-consumer ring of float64 records in shared memory.
+
+    The header holds the producer's ``head``, the consumer's ``tail`` (both
+    counting records ever written / read) and the consumer's processed
+    count. Each side only writes its own counter, so no lock is needed; a
+    full ring rejects the block and the producer counts it as dropped.
+    """
+
+    HEADER = 4
+
+    def __init__(self, capacity, width=RECORD_WIDTH, name=None):
+        self.capacity = capacity
+        self.width = width
+        size = 8 * (self.HEADER + capacity * width)
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = _attach(name)
+        self.header = np.ndarray((self.HEADER,), np.int64, self.shm.buf)
+        self.records = np.ndarray((capacity, width), np.float64, self.shm.buf, offset=8 * self.HEADER)
+        if name is None:
+            self.header[:] = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def __len__(self):
+        return int(self.header[0] - self.header[1])
+
+    def push(self, block):
+        """Copy ``block`` (rows x width) in; False if there is no room for all of it."""
+        head, tail = int(self.header[0]), int(self.header[1])
+        n = len(block)
+        if self.capacity - (head - tail) < n:
+            return False
+        i = head % self.capacity
+        first = min(n, self.capacity - i)
+        self.records[i:i + first] = block[:first]
+        self.records[:n - first] = block[first:]
+        # Publish only after the records are written
+        self.header[0] = head + n
+        return True
+
+    def pop(self):
+        """Copy out everything written so far (possibly nothing)."""
+        head, tail = int(self.header[0]), int(self.header[1])
+        n = head - tail
+        i = tail % self.capacity
+        first = min(n, self.capacity - i)
+        block = np.concatenate([self.records[i:i + first], self.records[:n - first]])
+        self.header[1] = head
+        return block
+
+    def close(self):
+        self.header = self.records = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before 3.13 attaching also registers the block, but workers share
+        # the parent's resource tracker, which already knows it
+        return shared_memory.SharedMemory(name=name)
+
+
+def _serve(index, ring_name, capacity, width, wakeup, names, results, stop, make_pipeline, load_model):
+    """Worker process: drain the ring into a Pipeline built here, send results back."""
+    from .bench import StageTimings
+
+    ring = SharedRing(capacity, width, name=ring_name)
+    timings = StageTimings()
+    pipeline = make_pipeline(on_prediction=lambda prediction: results.put(("prediction", prediction)),
+                             on_gesture=lambda event: results.put(("gesture", event)), timings=timings)
+    started = time.perf_counter()
+    try:
+        pipeline.model = load_model()
+    except Exception:
+        log.exception("Inference worker %d could not load the model", index)
+    results.put(("ready", index, time.perf_counter() - started))
+    devices = {}
+    next_stats = time.monotonic() + STATS_INTERVAL_S
+
+    def send_stats():
+        results.put(("stats", index, pipeline.stats(), dict(timings.samples)))
+        timings.samples.clear()
+
+    try:
+        while not stop.is_set():
+            if time.monotonic() >= next_stats:
+                send_stats()
+                next_stats = time.monotonic() + STATS_INTERVAL_S
+            due = pipeline.poll()
+            if not wakeup.acquire(timeout=0.5 if due is None else min(due, 0.5)):
+                continue
+            block = ring.pop()
+            retired = 0
+            for record in block:
+                number = int(record[0])
+                if np.isnan(record[1]):
+                    devices.pop(number, None)
+                    retired += 1
+                    continue
+                device_id = devices.get(number)
+                while device_id is None:
+                    # The name is sent before the device's first block, but on another channel
+                    n, name = names.get()
+                    devices[n] = name
+                    device_id = devices.get(number)
+                try:
+                    pipeline.process_sample(device_id, record[2:], record[1])
+                except Exception:
+                    log.exception("Worker %d failed on a sample from %s", index, device_id)
+            ring.header[2] += len(block) - retired
+        send_stats()
+    finally:
+        ring.close()
+
+
+class InferencePool:
+    """N inference processes, each owning the sessions of the devices sharded to it.
+
+    ``make_pipeline(on_prediction=..., on_gesture=..., timings=...)`` builds a worker's
+    Pipeline and ``load_model()`` its model; both run in the worker, so they
+    must be module-level functions (the default "spawn" start method
+    pickles them by name). ``on_prediction`` and ``on_gesture`` run in the
+    parent, on the pool's result thread. ``row_width`` is the width of the
+    sample rows, time included (9 for the glove, 2 for a single channel).
+    The workers' stage durations are passed on to ``timings.record`` and
+    ``pipeline_stats()`` sums their latest ``Pipeline.stats()``. Devices
+    that send nothing for ``idle_timeout_s`` stop counting toward their
+    worker's load.
+    """
+
+    def __init__(self, workers, make_pipeline, load_model, on_prediction=None, on_gesture=None,
+                 ring_size=8192, start_method="spawn", row_width=ROW_WIDTH, timings=None, idle_timeout_s=60):
+        self.workers = workers
+        self.make_pipeline = make_pipeline
+        self.load_model = load_model
+        self.on_prediction = on_prediction
+        self.on_gesture = on_gesture
+        self.timings = timings
+        self.idle_timeout_s = idle_timeout_s
+        self.ring_size = ring_size
+        self.width = row_width + 2
+        self.context = multiprocessing.get_context(start_method)
+        self.enqueued = 0
+        self.dropped = 0
+        self.ready = 0
+        self._rings = []
+        self._processes = []
+        self._devices = {}  # device_id -> (device number, worker index)
+        self._seen = {}     # device_id -> monotonic time of its last rows
+        self._load = [0] * workers
+        self._next_number = 0
+        self._next_sweep = 0.0
+        self._results = None
+        self._collector = None
+        self._worker_stats = {}
+
+    def start(self):
+        ctx = self.context
+        self._stop = ctx.Event()
+        self._results = ctx.Queue()
+        self._wakeups = [ctx.Semaphore(0) for _ in range(self.workers)]
+        self._names = [ctx.Queue() for _ in range(self.workers)]
+        for index in range(self.workers):
+            ring = SharedRing(self.ring_size, self.width)
+            process = ctx.Process(
+                target=_serve, name=f"inference-{index}", daemon=True,
+                args=(index, ring.name, self.ring_size, self.width, self._wakeups[index], self._names[index],
+                      self._results, self._stop, self.make_pipeline, self.load_model))
+            process.start()
+            self._rings.append(ring)
+            self._processes.append(process)
+        self._collector = threading.Thread(target=self._collect, name="inference-results", daemon=True)
+        self._collector.start()
+
+    def put(self, device_id, rows, received_at):
+        """Queue a device's ``(N, row_width)`` rows for its worker; False if they were dropped."""
+        if not self._rings:
+            self.dropped += len(rows)
+            return False
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._forget_idle(now)
+        self._seen[device_id] = now
+        known = self._devices.get(device_id)
+        if known is None:
+            index = self._load.index(min(self._load))
+            self._load[index] += 1
+            known = self._devices[device_id] = (self._next_number, index)
+            self._next_number += 1
+            self._names[index].put((known[0], device_id))
+        number, index = known
+        block = np.empty((len(rows), self.width))
+        block[:, 0] = number
+        block[:, 1] = received_at
+        block[:, 2:] = rows
+        if not self._rings[index].push(block):
+            self.dropped += len(rows)
+            return False
+        self.enqueued += len(rows)
+        self._wakeups[index].release()
+        return True
+
+    def _forget_idle(self, now):
+        """Retire devices idle for ``idle_timeout_s``; one whose worker's ring is full waits for the next sweep."""
+        self._next_sweep = now + self.idle_timeout_s / 4
+        for device_id, seen in list(self._seen.items()):
+            if now - seen < self.idle_timeout_s:
+                continue
+            number, index = self._devices[device_id]
+            retire = np.zeros((1, self.width))
+            retire[0, 0] = number
+            retire[0, 1] = np.nan
+            if self._rings[index].push(retire):
+                self._wakeups[index].release()
+                del self._devices[device_id], self._seen[device_id]
+                self._load[index] -= 1
+
+    def _collect(self):
+        while True:
+            item = self._results.get()
+            if item is None:
+                return
+            kind = item[0]
+            try:
+                if kind == "ready":
+                    self.ready += 1
+                    log.info("Inference worker %d ready in %.2fs", item[1], item[2])
+                elif kind == "prediction" and self.on_prediction is not None:
+                    self.on_prediction(item[1])
+                elif kind == "gesture" and self.on_gesture is not None:
+                    self.on_gesture(item[1])
+                elif kind == "stats":
+                    self._worker_stats[item[1]] = item[2]
+                    if self.timings is not None:
+                        for stage, durations in item[3].items():
+                            for seconds in durations:
+                                self.timings.record(stage, seconds)
+            except Exception:
+                log.exception("Failed to publish a %s", kind)
+
+    def pipeline_stats(self):
+        """The workers' latest pipeline counters, summed."""
+        total = Counter()
+        for stats in list(self._worker_stats.values()):
+            total.update(stats)
+        return total
+
+    def processed(self):
+        return sum(int(ring.header[2]) for ring in self._rings)
+
+    def queued(self):
+        return sum(len(ring) for ring in self._rings)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "ready": self.ready,
+            "queued": self.queued(),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "processed": self.processed(),
+            "per_worker": [int(ring.header[2]) for ring in self._rings],
+            "devices": len(self._devices),
+        }
+
+    def stop(self, timeout_s=5.0):
+        """Let the workers finish what is queued (up to ``timeout_s``), then shut them down."""
+        deadline = time.monotonic() + timeout_s
+        while self.queued() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self._stop.set()
+        for process in self._processes:
+            process.join(max(deadline - time.monotonic(), 0.1))
+            if process.is_alive():
+                process.terminate()
+        self._results.put(None)
+        self._collector.join()
+        for ring in self._rings:
+            ring.close()
+            ring.unlink()
+        self._rings, self._processes = [], []
+
+
+# --- Benchmark ---
+def _bench_pipeline(on_prediction=None, on_gesture=None, timings=None):
+    from .pipeline import Pipeline
+    from .sessions import DeviceSession, SessionManager
+
+    sessions = SessionManager(lambda device_id: DeviceSession(device_id, 4000, 500, 8), max_sessions=1024)
+    return Pipeline(None, sessions, on_prediction=on_prediction, predict_interval_ms=250, timings=timings)
+
+
+def _bench_blocks(recording, block):
+    """``(device_id, rows)`` in arrival order, ``block`` samples per message."""
+    messages = []
+    for index, device_id in enumerate(recording.devices):
+        rows = recording.samples[recording.device == index]
+        for i, lo in enumerate(range(0, len(rows), block)):
+            messages.append((i, index, device_id, rows[lo:lo + block]))
+    messages.sort(key=lambda m: (m[0], m[1]))
+    return [(device_id, rows) for _, _, device_id, rows in messages]
+
+
+def _run_inline(model, messages):
+    pipeline = _bench_pipeline()
+    pipeline.model = model
+    started = time.perf_counter()
+    for device_id, rows in messages:
+        for values in rows:
+            pipeline.process_sample(device_id, values)
+    return time.perf_counter() - started
+
+
+def _run_pool(workers, load_model, messages, total):
+    predictions = []
+    pool = InferencePool(workers, _bench_pipeline, load_model, on_prediction=predictions.append)
+    pool.start()
+    while pool.ready < workers:
+        time.sleep(0.01)
+    started = time.perf_counter()
+    for device_id, rows in messages:
+        while not pool.put(device_id, rows, time.perf_counter()):
+            pool.dropped -= len(rows)  # ring full: wait for the worker rather than drop
+            time.sleep(0.001)
+    while pool.processed() < total:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - started
+    stats = pool.stats()
+    pool.stop()
+    return elapsed, stats, len(predictions)
+
+
+def main(argv=None):
+    import argparse
+    import tempfile
+
+    from .backends import FlatForestBackend
+    from .bench import synthetic_model
+    from .recording import synthetic_recording
+
+    parser = argparse.ArgumentParser(description="Measure inference throughput against worker count.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--devices", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=30, help="synthetic session length per device")
+    parser.add_argument("--block", type=int, default=10, help="samples per message")
+    parser.add_argument("--estimators", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    recording = synthetic_recording(args.seconds, 100, args.devices)
+    model = FlatForestBackend.from_sklearn(synthetic_model(recording, args.estimators))
+    messages = _bench_blocks(recording, args.block)
+    total = len(recording.samples)
+    print(f"{args.devices} devices, {total} samples, {os.cpu_count()} CPUs")
+
+    elapsed = _run_inline(model, messages)
+    print(f"in-process   {total / elapsed:>10.0f} samples/s")
+    with tempfile.TemporaryDirectory() as tmp:
+        model.save(tmp)
+        load_model = functools.partial(FlatForestBackend.load, tmp, mmap_mode="r")
+        for workers in args.workers:
+            elapsed, stats, predictions = _run_pool(workers, load_model, messages, total)
+            print(f"{workers} worker(s)  {total / elapsed:>10.0f} samples/s  "
+                  f"{predictions} predictions  per worker {stats['per_worker']}")
+
+
+if __name__ == "__main__":
+    main()
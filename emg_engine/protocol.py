@@ -0,0 +1,123 @@
+"""MQTT sample payload formats.
+
+Binary frame, version 1 (all fields little-endian)::
+
+    header  12 bytes  magic "EM", uint8 version, uint8 flags,
+                      uint16 device_id, uint32 seq, uint16 count
+    record  32 bytes  uint32 time_ms, uint16 emg1, uint16 emg2,
+                      float32 acc_x, acc_y, acc_z, gyro_x, gyro_y, gyro_z
+
+``seq`` numbers the first record in the frame; a frame carries ``count``
+consecutive samples. ``device_id`` 0 means "unset" and the MQTT topic
+decides the device instead. Older firmware sends JSON
+(``{"value": {"time": ..., "emg1": ..., ...}}``) or a brace-wrapped CSV
+row; both still decode to the same ``(N, 9)`` sample array.
+
+The single-channel sensor publishes ``{"value": 512}`` with no time at
+all; ``decode_value`` stamps it on arrival and returns a ``(1, 2)`` array.
+"""
+import json
+import struct
+import time
+from collections import namedtuple
+
+import numpy as np
+
+MAGIC = b"EM"
+VERSION = 1
+HEADER = struct.Struct("<2sBBHIH")
+RECORD_DTYPE = np.dtype([
+    ("time", "<u4"),
+    ("emg", "<u2", (2,)),
+    ("imu", "<f4", (6,)),
+])
+JSON_FIELDS = ("time", "emg1", "emg2", "acc_x", "acc_y", "acc_z", "gyro_x", "gyro_y", "gyro_z")
+N_COLUMNS = len(JSON_FIELDS)
+
+# samples is an (N, 9) float64 array: time, emg1, emg2, acc xyz, gyro xyz
+Frame = namedtuple("Frame", ["device_id", "seq", "samples"])
+
+
+def encode_binary(samples, device_id=0, seq=0, flags=0):
+    """Pack an (N, 9) sample array into a version 1 binary frame."""
+    samples = np.asarray(samples, dtype=np.float64).reshape(-1, N_COLUMNS)
+    records = np.empty(len(samples), dtype=RECORD_DTYPE)
+    records["time"] = samples[:, 0]
+    records["emg"] = samples[:, 1:3]
+    records["imu"] = samples[:, 3:]
+    header = HEADER.pack(MAGIC, VERSION, flags, device_id, seq, len(samples))
+    return header + records.tobytes()
+
+
+def encode_json(samples):
+    """Encode samples the way the JSON firmware does (one sample per message)."""
+    rows = [dict(zip(JSON_FIELDS, map(float, row)))
+            for row in np.asarray(samples).reshape(-1, N_COLUMNS)]
+    return json.dumps({"value": rows[0] if len(rows) == 1 else rows}).encode()
+
+
+def encode_csv(sample):
+    """Encode one sample as the brace-wrapped CSV row older firmware sends."""
+    return ("{" + ",".join(repr(float(v)) for v in np.ravel(sample)) + "}").encode()
+
+
+def decode_binary(payload):
+    if len(payload) < HEADER.size:
+        raise ValueError(f"Frame shorter than its {HEADER.size}-byte header")
+    magic, version, _, device_id, seq, count = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Unsupported frame {magic!r} v{version}")
+    expected = HEADER.size + count * RECORD_DTYPE.itemsize
+    if len(payload) != expected:
+        raise ValueError(f"Frame length {len(payload)} does not match {count} records")
+    records = np.frombuffer(payload, dtype=RECORD_DTYPE, count=count, offset=HEADER.size)
+    samples = np.empty((count, N_COLUMNS))
+    samples[:, 0] = records["time"]
+    samples[:, 1:3] = records["emg"]
+    samples[:, 3:] = records["imu"]
+    return Frame(str(device_id) if device_id else None, seq, samples)
+
+
+def decode_json(text):
+    data = json.loads(text)
+    if isinstance(data, list):
+        data = {"value": data}
+    device_id = data.get("device_id")
+    values = data.get("value", data)
+    if isinstance(values, dict):
+        values = [values]
+    try:
+        rows = [[float(v[field]) for field in JSON_FIELDS] for v in values]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"JSON sample missing field {e}") from None
+    return Frame(None if device_id is None else str(device_id), data.get("seq"),
+                 np.array(rows).reshape(-1, N_COLUMNS))
+
+
+def decode_csv(text):
+    values = [float(x) for x in text.replace("{", "").replace("}", "").split(",")]
+    if len(values) != N_COLUMNS:
+        raise ValueError(f"Expected {N_COLUMNS} values, got {len(values)}")
+    return Frame(None, None, np.array(values).reshape(1, N_COLUMNS))
+
+
+def decode_value(payload, clock=time.time):
+    """Decode a single-channel ``{"value": x}`` payload, timed by ``clock()`` in host milliseconds."""
+    text = bytes(payload).split(b"\x00", 1)[0].decode("utf-8")
+    try:
+        value = float(json.loads(text)["value"])
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Not a single-channel sample: {e}") from None
+    return Frame(None, None, np.array([[clock() * 1000.0, value]]))
+
+
+def decode_payload(payload):
+    """Decode any supported payload into a Frame; raises ValueError on bad input."""
+    payload = bytes(payload)
+    if payload[:2] == MAGIC:
+        return decode_binary(payload)
+    # Some firmware pads the publish with NUL bytes
+    text = payload.split(b"\x00", 1)[0].decode("utf-8").strip()
+    if text.startswith('{"') or text.startswith("["):
+        return decode_json(text)
+    return decode_csv(text)
@@ -0,0 +1,116 @@
+"""Raw sample recording and replay.
+
+A recording is an uncompressed ``.npz`` holding one array per column:
+``device`` (index into ``devices``), ``received`` (host clock, seconds) and
+the nine sample columns from ``protocol.JSON_FIELDS``. Replay re-encodes
+the samples into MQTT payloads and pushes them through a pipeline's
+``handle_message`` with no broker involved.
+"""
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from .protocol import JSON_FIELDS, N_COLUMNS, encode_binary, encode_csv, encode_json
+
+Recording = namedtuple("Recording", ["devices", "device", "received", "samples", "label"])
+
+
+class Recorder:
+    """Collects raw samples as they arrive; ``save`` writes them out column by column."""
+
+    def __init__(self, path, label=None):
+        self.path = path
+        self.label = label
+        self._devices = {}
+        self._chunks = []
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def add(self, device_id, rows, received_at=None):
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, N_COLUMNS)
+        received_at = time.time() if received_at is None else received_at
+        with self._lock:
+            index = self._devices.setdefault(device_id, len(self._devices))
+            self._chunks.append((index, received_at, rows))
+            self._count += len(rows)
+
+    def save(self):
+        with self._lock:
+            chunks = list(self._chunks)
+            devices = sorted(self._devices, key=self._devices.get)
+        if chunks:
+            samples = np.concatenate([rows for _, _, rows in chunks])
+            device = np.concatenate([np.full(len(rows), i, np.uint16) for i, _, rows in chunks])
+            received = np.concatenate([np.full(len(rows), t) for _, t, rows in chunks])
+        else:
+            samples = np.empty((0, N_COLUMNS))
+            device = np.empty(0, np.uint16)
+            received = np.empty(0)
+        save_recording(self.path, Recording(devices, device, received, samples, self.label))
+        return self.path
+
+
+def save_recording(path, recording):
+    # Device millis stay float64, the sensor channels fit in float32
+    columns = {name: recording.samples[:, i].astype(np.float32 if i else np.float64)
+               for i, name in enumerate(JSON_FIELDS)}
+    np.savez(path, devices=np.array(recording.devices, dtype=str), device=recording.device,
+             received=recording.received, label=np.array(recording.label or ""), **columns)
+
+
+def load_recording(path):
+    with np.load(path) as data:
+        samples = np.column_stack([data[name].astype(np.float64) for name in JSON_FIELDS])
+        label = str(data["label"]) or None
+        return Recording([str(d) for d in data["devices"]], data["device"], data["received"], samples, label)
+
+
+def synthetic_recording(duration_s=60, rate_hz=100, n_devices=1, seed=0):
+    """Glove-like data: resting noise with periodic bursts of EMG and motion."""
+    rng = np.random.default_rng(seed)
+    n = int(duration_s * rate_hz)
+    devices, parts = [], []
+    for d in range(n_devices):
+        t_ms = np.arange(n) * (1000.0 / rate_hz) + rng.uniform(0, 1000.0 / rate_hz)
+        active = (np.sin(2 * np.pi * (t_ms / 3000.0 + d / max(n_devices, 1))) > 0.6)[:, None]
+        emg = 1800 + rng.normal(0, 30, (n, 2)) + active * rng.normal(0, 600, (n, 2))
+        acc = np.array([0, 0, 9.8]) + rng.normal(0, 0.05, (n, 3)) + active * rng.normal(0, 2, (n, 3))
+        gyro = rng.normal(0, 0.02, (n, 3)) + active * rng.normal(0, 1.5, (n, 3))
+        samples = np.column_stack([np.round(t_ms), np.clip(np.round(emg), 0, 4095), acc, gyro])
+        devices.append(f"glove{d}")
+        parts.append((np.full(n, d, np.uint16), t_ms / 1000.0, samples))
+    device = np.concatenate([p[0] for p in parts])
+    received = np.concatenate([p[1] for p in parts])
+    samples = np.concatenate([p[2] for p in parts])
+    order = np.argsort(received, kind="stable")
+    return Recording(devices, device[order], received[order], samples[order], None)
+
+
+def encode_messages(recording, fmt="binary", base_topic="esp32/emg"):
+    """Turn a recording into ``(received, topic, payload)`` tuples, one sample per message."""
+    encode = {"binary": encode_binary, "json": encode_json, "csv": encode_csv}[fmt]
+    topics = [f"{base_topic}/{d}" for d in recording.devices]
+    return [(received, topics[device], encode(row))
+            for device, received, row in zip(recording.device, recording.received, recording.samples)]
+
+
+def replay(messages, handle, speed=1.0):
+    """Push encoded messages into ``handle(topic, payload)``.
+
+    ``speed`` 1.0 keeps the recorded timing, N plays N times faster and None
+    replays as fast as possible. Returns the elapsed wall time in seconds.
+    """
+    started = time.perf_counter()
+    first = messages[0][0] if messages else 0.0
+    for received, topic, payload in messages:
+        if speed:
+            delay = (received - first) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+        handle(topic, payload)
+    return time.perf_counter() - started
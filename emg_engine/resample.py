@@ -0,0 +1,141 @@
+"""Put irregular device streams on a fixed-rate grid.
+
+The gloves stamp samples with their own millisecond clock, but the actual
+rate jitters with WiFi and firmware delays, so a 500 ms window holds a
+varying number of samples and count-dependent features (IEMG, WL, ZC)
+drift with it. Resampling linearly onto ``1000 / rate_hz`` ms steps makes
+every window the same length. Duplicates and out-of-order samples are
+dropped, short gaps are interpolated, and gaps longer than
+``max_gap_ms`` restart the grid so no window straddles them.
+"""
+import math
+
+import numpy as np
+
+DUPLICATE = "duplicate"
+OUT_OF_ORDER = "out_of_order"
+GAP = "gap"
+RESTART = "restart"
+
+
+def clean(times, values):
+    """Keep only samples newer than every sample before them.
+
+    Returns ``(times, values, duplicates, out_of_order)``.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    if len(times) < 2:
+        return times, np.asarray(values), 0, 0
+    newest_before = np.maximum.accumulate(times)[:-1]
+    keep = np.ones(len(times), dtype=bool)
+    keep[1:] = times[1:] > newest_before
+    duplicates = int(np.count_nonzero(times[1:] == newest_before))
+    return times[keep], np.asarray(values)[keep], duplicates, len(times) - int(keep.sum()) - duplicates
+
+
+def _interpolate(times, values, grid):
+    # Index of the sample at or before each grid point, with a right neighbour
+    left = np.clip(np.searchsorted(times, grid, side="right") - 1, 0, len(times) - 2)
+    span = times[left + 1] - times[left]
+    frac = ((grid - times[left]) / span)[:, None]
+    return values[left] + frac * (values[left + 1] - values[left])
+
+
+def resample(times, values, rate_hz, max_gap_ms=200):
+    """Resample a whole recording onto a fixed-rate grid.
+
+    Returns ``(grid_times, grid_values, segments)`` where ``segments`` is the
+    number of gap-free runs; each run's grid starts at its first sample.
+    """
+    times, values, _, _ = clean(times, values)
+    values = np.asarray(values, dtype=np.float64)
+    if len(times) == 0:
+        return times, values.reshape(0, *values.shape[1:]), 0
+    period = 1000.0 / rate_hz
+    breaks = np.flatnonzero(np.diff(times) > max_gap_ms) + 1
+    out_t, out_v = [], []
+    for lo, hi in zip(np.r_[0, breaks], np.r_[breaks, len(times)]):
+        t, v = times[lo:hi], values[lo:hi]
+        grid = t[0] + period * np.arange(int(math.floor((t[-1] - t[0]) / period)) + 1)
+        out_t.append(grid)
+        out_v.append(v[:1].repeat(len(grid), axis=0) if len(t) == 1 else _interpolate(t, v, grid))
+    return np.concatenate(out_t), np.concatenate(out_v), len(breaks) + 1
+
+
+class StreamResampler:
+    """Incremental ``resample`` for one device, fed a sample at a time.
+
+    ``add`` returns ``(status, times, values)``: the grid points that became
+    known with this sample (often none or one), and a status that is None
+    for an ordinary sample or one of DUPLICATE / OUT_OF_ORDER (sample
+    dropped), GAP (grid restarted after more than ``max_gap_ms``) or RESTART
+    (the device clock jumped back by more than ``restart_ms``).
+    """
+
+    def __init__(self, rate_hz=100, max_gap_ms=200, restart_ms=1000):
+        self.period = 1000.0 / rate_hz
+        self.max_gap_ms = max_gap_ms
+        self.restart_ms = restart_ms
+        self.reset()
+
+    def reset(self):
+        self._time = self._values = None
+        self._origin = None
+        self._index = 0
+        self._no_times = self._no_values = None
+
+    def _empty(self, status):
+        return status, self._no_times, self._no_values
+
+    def _start(self, timestamp, values):
+        self._origin = timestamp
+        self._index = 1
+        self._time, self._values = timestamp, values
+        return np.array([timestamp]), values[None, :]
+
+    def add(self, timestamp, values):
+        values = np.asarray(values, dtype=np.float64)
+        if self._time is None:
+            # Shared empty results for samples that complete no grid point
+            self._no_times, self._no_values = np.empty(0), np.empty((0, len(values)))
+            return (None,) + self._start(timestamp, values)
+        if timestamp == self._time:
+            return self._empty(DUPLICATE)
+        if timestamp < self._time:
+            if self._time - timestamp < self.restart_ms:
+                return self._empty(OUT_OF_ORDER)
+            return (RESTART,) + self._start(timestamp, values)
+        if timestamp - self._time > self.max_gap_ms:
+            return (GAP,) + self._start(timestamp, values)
+
+        first = self._origin + self._index * self.period
+        previous_time, previous = self._time, self._values
+        self._time, self._values = timestamp, values
+        if timestamp < first:
+            return self._empty(None)
+        count = int(math.floor((timestamp - first) / self.period)) + 1
+        grid = first + self.period * np.arange(count)
+        frac = ((grid - previous_time) / (timestamp - previous_time))[:, None]
+        self._index += count
+        return None, grid, previous + frac * (values - previous)
+
+
+class SequenceTracker:
+    """Counts samples lost between binary frames, from their ``seq`` numbers."""
+
+    def __init__(self):
+        self._next = {}
+        self.lost = 0
+        self.reordered = 0
+
+    def check(self, device_id, seq, count):
+        """Record a frame of ``count`` samples starting at ``seq``; returns how many were skipped."""
+        expected = self._next.get(device_id)
+        if expected is not None and 0 < seq < expected:
+            # A late frame; the device restarting its counter would start over at 0
+            self.reordered += 1
+            return 0
+        self._next[device_id] = seq + count
+        lost = seq - expected if expected is not None and seq > expected else 0
+        self.lost += lost
+        return lost
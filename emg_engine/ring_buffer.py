@@ -0,0 +1,131 @@
+import numpy as np
+
+
+class SampleRingBuffer:
+    """Fixed-capacity sample window backed by preallocated NumPy arrays.
+
+    Every sample is written twice (at ``i`` and ``i + capacity``) so the
+    buffered samples are always one contiguous slice of the storage and all
+    window accessors return views instead of copies. Timestamps are kept as
+    float64 so device millis don't lose precision after a few hours; the
+    channel columns default to float32.
+
+    A window of ``duration_ms`` ending at the newest sample is half-open,
+    ``(newest - duration_ms, newest]``, like the ``[start, start + window)``
+    windows training cuts: on a 10 ms grid a 500 ms window is 50 samples
+    either way, however large the buffer.
+    """
+
+    def __init__(self, capacity, n_channels=8, dtype=np.float32):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = int(capacity)
+        self.n_channels = n_channels
+        self.dtype = np.dtype(dtype)
+        self._times = np.zeros(2 * self.capacity, dtype=np.float64)
+        self._values = np.zeros((2 * self.capacity, n_channels), dtype=dtype)
+        self._end = 0   # next write position, always < capacity
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def newest_time(self):
+        return self._times[self._end + self.capacity - 1]
+
+    @property
+    def oldest_time(self):
+        return self._times[self._end + self.capacity - self._size]
+
+    def clear(self):
+        self._end = 0
+        self._size = 0
+
+    def append(self, timestamp, values):
+        """Add one sample, overwriting the oldest one when the buffer is full."""
+        i = self._end
+        j = i + self.capacity
+        self._times[i] = self._times[j] = timestamp
+        self._values[i] = self._values[j] = values
+        self._end = (i + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def extend(self, times, values):
+        """Add a block of samples (oldest first), as ``append`` would one by one."""
+        times, values = times[-self.capacity:], values[-self.capacity:]
+        count = len(times)
+        i = (self._end + np.arange(count)) % self.capacity
+        j = i + self.capacity
+        self._times[i] = self._times[j] = times
+        self._values[i] = self._values[j] = values
+        self._end = (self._end + count) % self.capacity
+        self._size = min(self._size + count, self.capacity)
+
+    def _slice(self, count):
+        stop = self._end + self.capacity
+        return slice(stop - count, stop)
+
+    def window(self):
+        """Return ``(times, values)`` views of every buffered sample, oldest first."""
+        s = self._slice(self._size)
+        return self._times[s], self._values[s]
+
+    def count_before(self, min_time):
+        """Number of buffered samples with a timestamp older than ``min_time``."""
+        if self._size == 0 or self.oldest_time >= min_time:
+            return 0
+        times = self._times[self._slice(self._size)]
+        return int(np.searchsorted(times, min_time, side="left"))
+
+    def count_through(self, max_time):
+        """Number of buffered samples with a timestamp at or before ``max_time``."""
+        if self._size == 0 or self.oldest_time > max_time:
+            return 0
+        times = self._times[self._slice(self._size)]
+        return int(np.searchsorted(times, max_time, side="right"))
+
+    def evict_before(self, min_time):
+        """Drop samples older than ``min_time`` and return how many were dropped.
+
+        Timestamps are assumed non-decreasing, so the common case (nothing or
+        a single sample to drop) is O(1).
+        """
+        count = self.count_before(min_time)
+        self._size -= count
+        return count
+
+    def evict_window(self, duration_ms):
+        """Drop the samples outside ``(newest - duration_ms, newest]``; returns how many."""
+        if self._size == 0:
+            return 0
+        count = self.count_through(self.newest_time - duration_ms)
+        self._size -= count
+        return count
+
+    def drop(self, count):
+        """Drop the ``count`` oldest samples."""
+        self._size -= min(count, self._size)
+
+    def oldest(self, count):
+        """Return ``(times, values)`` views of the ``count`` oldest samples."""
+        count = min(count, self._size)
+        stop = self._end + self.capacity - self._size + count
+        s = slice(stop - count, stop)
+        return self._times[s], self._values[s]
+
+    def last(self, count):
+        """Return ``(times, values)`` views of the ``count`` newest samples."""
+        s = self._slice(min(count, self._size))
+        return self._times[s], self._values[s]
+
+    def since(self, min_time):
+        """Return ``(times, values)`` views of samples with ``time >= min_time``."""
+        return self.last(self._size - self.count_before(min_time))
+
+    def last_ms(self, duration_ms):
+        """Return views of the samples in ``(newest - duration_ms, newest]``."""
+        if self._size == 0:
+            return self.window()
+        return self.last(self._size - self.count_through(self.newest_time - duration_ms))
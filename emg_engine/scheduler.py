@@ -0,0 +1,80 @@
+"""Micro-batching: score the feature rows of many gloves with one model call."""
+import time
+
+import numpy as np
+
+
+class BatchScheduler:
+    """Collects feature rows across sessions and runs them through ``predict_proba`` together.
+
+    A forest call costs about the same for one row as for a few dozen, so
+    rows are held until the batch has ``max_batch`` rows or its oldest row
+    has waited ``deadline_ms``; ``deadline_ms`` 0 scores every row at once
+    (no batching). Each row carries a ``context`` that comes back with its
+    probabilities, in submission order. Whoever drives the scheduler must
+    call ``poll()`` at least every ``wait_s()`` seconds so a partial batch
+    does not sit past its deadline.
+
+    When ``timings`` is given, ``batch_wait`` (per row) and ``predict``
+    (per batch) are recorded.
+    """
+
+    def __init__(self, max_batch=32, deadline_ms=10, timings=None):
+        self.max_batch = max_batch
+        self.deadline_s = deadline_ms / 1000.0
+        self.timings = timings
+        self.batches = 0
+        self.rows = 0
+        self.full_batches = 0
+        self._features = []
+        self._contexts = []
+        self._submitted = []
+
+    def __len__(self):
+        return len(self._features)
+
+    def mean_batch(self):
+        return self.rows / self.batches if self.batches else 0.0
+
+    def submit(self, features, context, model, now=None):
+        """Queue one row; returns ``[(context, probs), ...]`` if this filled or expired the batch."""
+        now = time.perf_counter() if now is None else now
+        self._features.append(features)
+        self._contexts.append(context)
+        self._submitted.append(now)
+        if len(self._features) >= self.max_batch:
+            self.full_batches += 1
+            return self.flush(model)
+        return self.poll(model, now)
+
+    def poll(self, model, now=None):
+        """Flush the batch if its oldest row has waited out the deadline."""
+        if not self._features:
+            return []
+        now = time.perf_counter() if now is None else now
+        if now - self._submitted[0] < self.deadline_s:
+            return []
+        return self.flush(model)
+
+    def wait_s(self, now=None):
+        """Seconds until the pending batch is due, or None when nothing is pending."""
+        if not self._features:
+            return None
+        now = time.perf_counter() if now is None else now
+        return max(self._submitted[0] + self.deadline_s - now, 0.0)
+
+    def flush(self, model):
+        """Score everything pending now."""
+        if not self._features:
+            return []
+        features, contexts, submitted = self._features, self._contexts, self._submitted
+        self._features, self._contexts, self._submitted = [], [], []
+        started = time.perf_counter()
+        probs = model.predict_proba(np.vstack(features))
+        if self.timings is not None:
+            self.timings.record("predict", time.perf_counter() - started)
+            for t in submitted:
+                self.timings.record("batch_wait", started - t)
+        self.batches += 1
+        self.rows += len(features)
+        return list(zip(contexts, probs))
@@ -0,0 +1,149 @@
+import time
+from collections import OrderedDict
+
+from .features import FEATURES, extract_features
+from .incremental import IncrementalFeatures
+from .ring_buffer import SampleRingBuffer
+
+DEFAULT_DEVICE = "default"
+
+
+def device_id_from_topic(topic, base_topic):
+    """``esp32/emg/<id>`` -> ``<id>``; the bare base topic maps to the default device."""
+    if topic == base_topic:
+        return DEFAULT_DEVICE
+    prefix = base_topic.rstrip("/") + "/"
+    if topic.startswith(prefix) and len(topic) > len(prefix):
+        return topic[len(prefix):]
+    return None
+
+
+class DeviceSession:
+    """Window and feature state for a single glove.
+
+    No features are computed until the sub-window holds ``min_samples``.
+    """
+
+    def __init__(self, device_id, main_window_ms, sub_window_ms, n_channels=8,
+                 max_sample_rate=1000, incremental=True, features=FEATURES, min_samples=1):
+        self.device_id = device_id
+        self.main_window_ms = main_window_ms
+        self.sub_window_ms = sub_window_ms
+        self.features = tuple(features)
+        self.min_samples = max(min_samples, 1)
+        self.buffer = SampleRingBuffer(main_window_ms * max_sample_rate // 1000, n_channels)
+        self.sub_window = None
+        if incremental:
+            self.sub_window = IncrementalFeatures(sub_window_ms, n_channels,
+                                                  capacity=sub_window_ms * max_sample_rate // 1000,
+                                                  features=features)
+        self.last_prediction_time = 0
+        self.last_seen = time.monotonic()
+        self.sample_count = 0
+        # Per-device resampler, rest detector and gesture segmenter, created by the Pipeline
+        self.resampler = None
+        self.activity = None
+        self.segmenter = None
+
+    def add_sample(self, timestamp, values, update_features=True):
+        """Append one sample to the windows, restarting them if the clock went back.
+
+        With ``update_features`` False only the main buffer is written; the
+        incremental sub-window is left alone until ``preroll`` rebuilds it.
+        """
+        self.last_seen = time.monotonic()
+        self.sample_count += 1
+
+        # Device clock went backwards (ESP32 restarted), start a fresh window
+        if len(self.buffer) and timestamp < self.buffer.newest_time:
+            self.reset_windows()
+
+        self.buffer.append(timestamp, values)
+        if self.sub_window is not None and update_features:
+            self.sub_window.update(timestamp, values)
+
+        # Keep only data from the last main_window_ms milliseconds
+        self.buffer.evict_window(self.main_window_ms)
+
+    def reset_windows(self):
+        """Forget the buffered samples, e.g. after a gap no window should straddle."""
+        self.buffer.clear()
+        if self.sub_window is not None:
+            self.sub_window.reset()
+        self.last_prediction_time = 0
+
+    def preroll(self, duration_ms):
+        """Rebuild the incremental sub-window from the last ``duration_ms`` of the main buffer."""
+        if self.sub_window is not None and len(self.buffer):
+            times, values = self.buffer.last_ms(duration_ms)
+            self.sub_window.load(times, values)
+
+    def prediction_due(self, timestamp, interval_ms):
+        return timestamp - self.last_prediction_time >= interval_ms
+
+    def current_features(self):
+        """Feature vector for the latest sub-window, or None while it is too short."""
+        if self.sub_window is not None:
+            if len(self.sub_window) < self.min_samples:
+                return None
+            return self.sub_window.snapshot()
+        if len(self.buffer) == 0:
+            return None
+        _, window = self.buffer.last_ms(self.sub_window_ms)
+        if len(window) < self.min_samples:
+            return None
+        return extract_features(window, self.features)
+
+
+class SessionManager:
+    """Creates sessions on first sight of a device and evicts idle ones.
+
+    Sessions unseen for ``idle_timeout_s`` are dropped on the next sweep,
+    and the least recently seen session is dropped whenever a new device
+    would exceed ``max_sessions``, so memory stays bounded.
+    """
+
+    def __init__(self, factory, idle_timeout_s=60, max_sessions=64, sweep_interval_s=5):
+        self.factory = factory
+        self.idle_timeout_s = idle_timeout_s
+        self.max_sessions = max_sessions
+        self.sweep_interval_s = sweep_interval_s
+        self.evicted = 0
+        self._sessions = OrderedDict()
+        self._last_sweep = time.monotonic()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, device_id):
+        return device_id in self._sessions
+
+    def ids(self):
+        return list(self._sessions)
+
+    def get(self, device_id):
+        session = self._sessions.get(device_id)
+        if session is None:
+            while len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+            session = self._sessions[device_id] = self.factory(device_id)
+        else:
+            self._sessions.move_to_end(device_id)
+        return session
+
+    def evict_idle(self, now=None):
+        """Drop sessions idle for longer than idle_timeout_s; returns their ids."""
+        now = time.monotonic() if now is None else now
+        self._last_sweep = now
+        stale = [d for d, s in self._sessions.items() if now - s.last_seen > self.idle_timeout_s]
+        for device_id in stale:
+            del self._sessions[device_id]
+        self.evicted += len(stale)
+        return stale
+
+    def maybe_evict_idle(self):
+        now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_interval_s:
+            return self.evict_idle(now)
+        return []
@@ -0,0 +1,93 @@
+"""Turn the per-window probability stream into one event per gesture."""
+from collections import deque, namedtuple
+
+import numpy as np
+
+# start/end are device milliseconds; confidence is the mean smoothed probability
+GestureEvent = namedtuple("GestureEvent", ["device_id", "label", "start", "end", "confidence"])
+
+
+class GestureSegmenter:
+    """Smooths ``predict_proba`` vectors and segments them with hysteresis.
+
+    ``method`` "ema" averages the vectors exponentially with ``alpha``;
+    "vote" uses the share of the last ``votes`` windows won by each class.
+    A gesture starts once a class's smoothed score reaches ``enter`` and
+    lasts until it drops below ``exit`` (or another class takes over, or
+    ``rest()`` is called). A gesture held past ``max_duration_ms`` is closed
+    and, if still held, starts again, so a classifier that never lets go
+    still produces events. Finished segments of at least ``min_duration_ms``
+    are returned as ``(class_index, start, end, confidence)``.
+    """
+
+    def __init__(self, method="ema", alpha=0.4, votes=5, enter=0.6, exit=0.4, min_duration_ms=0,
+                 max_duration_ms=None):
+        if method not in ("ema", "vote"):
+            raise ValueError(f"Unknown smoothing method {method!r}")
+        self.method = method
+        self.alpha = alpha
+        self.enter = enter
+        self.exit = exit
+        self.min_duration_ms = min_duration_ms
+        self.max_duration_ms = max_duration_ms
+        self._history = deque(maxlen=votes)
+        self.reset()
+
+    def reset(self):
+        self.smoothed = None
+        self._history.clear()
+        self.current = None  # class index of the gesture in progress
+        self._start = self._last = None
+        self._scores = []
+
+    def _smooth(self, probs):
+        if self.method == "ema":
+            if self.smoothed is None:
+                self.smoothed = probs.copy()
+            else:
+                self.smoothed += self.alpha * (probs - self.smoothed)
+        else:
+            self._history.append(int(np.argmax(probs)))
+            counts = np.bincount(self._history, minlength=len(probs))
+            self.smoothed = counts / len(self._history)
+        return self.smoothed
+
+    def _finish(self):
+        segment = None
+        if self._last - self._start >= self.min_duration_ms:
+            segment = (self.current, self._start, self._last, float(np.mean(self._scores)))
+        self.current = None
+        self._start = self._last = None
+        self._scores = []
+        return segment
+
+    def update(self, timestamp, probs):
+        """Add one window's probabilities; returns the list of segments that just ended."""
+        smoothed = self._smooth(np.asarray(probs, dtype=np.float64))
+        best = int(np.argmax(smoothed))
+        finished = []
+        if self.current is not None:
+            too_long = self.max_duration_ms is not None and timestamp - self._start >= self.max_duration_ms
+            if (too_long or smoothed[self.current] < self.exit
+                    or (best != self.current and smoothed[best] >= self.enter)):
+                segment = self._finish()
+                if segment is not None:
+                    finished.append(segment)
+            else:
+                self._last = timestamp
+                self._scores.append(smoothed[self.current])
+        if self.current is None and smoothed[best] >= self.enter:
+            self.current = best
+            self._start = self._last = timestamp
+            self._scores = [smoothed[best]]
+        return finished
+
+    def rest(self):
+        """The hand went still: end any gesture in progress and forget the history."""
+        finished = []
+        if self.current is not None:
+            segment = self._finish()
+            if segment is not None:
+                finished.append(segment)
+        self.reset()
+        return finished
@@ -0,0 +1,360 @@
+"""Append-only session storage: raw samples and predictions per device, on disk.
+
+    python -m emg_engine.storage bench --devices 16 --seconds 60
+    python -m emg_engine.storage read store/ glove1 --start 1718000000 --end 1718000060
+
+A store is a directory of segments. Each segment has three files of
+fixed-size little-endian records, only ever appended to::
+
+    NNNNNN.samples      SAMPLE_DTYPE      48 bytes per sample
+    NNNNNN.predictions  PREDICTION_DTYPE  per window prediction or gesture
+    NNNNNN.index        INDEX_DTYPE       one entry per device per write
+
+Every write groups its records by device, so each index entry points at
+one contiguous run (``offset``, ``count``) of a single device covering
+host times ``t_min``..``t_max`` (``time.time()`` seconds). A range read
+only opens the runs whose entry overlaps the device and time asked for.
+The index entry is written after its records, so a crash leaves at most
+unindexed trailing bytes, never an entry pointing past the data. A write
+that fails part way is truncated back to the end of the last good one, so
+the offsets of later entries stay in step with the data files.
+
+``SessionStore`` queues what it is given and writes from its own thread
+in bulk; when the queue is full the new data is dropped and counted, so
+ingestion never waits on the disk. A segment is closed and a new one
+started when its samples file passes ``roll_bytes`` or it is older than
+``roll_s``.
+"""
+import glob
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from .protocol import N_COLUMNS
+
+log = logging.getLogger(__name__)
+
+SAMPLE_DTYPE = np.dtype([
+    ("received", "<f8"),
+    ("time", "<f8"),
+    ("values", "<f4", (N_COLUMNS - 1,)),
+])
+# kind 0 is a window prediction (start == end), 1 a gesture event
+PREDICTION_DTYPE = np.dtype([
+    ("received", "<f8"),
+    ("start", "<f8"),
+    ("end", "<f8"),
+    ("confidence", "<f4"),
+    ("kind", "u1"),
+    ("label", "S27"),
+])
+INDEX_DTYPE = np.dtype([
+    ("stream", "u1"),
+    ("device", "S63"),
+    ("t_min", "<f8"),
+    ("t_max", "<f8"),
+    ("offset", "<i8"),
+    ("count", "<i8"),
+])
+SAMPLES, PREDICTIONS = 0, 1
+STREAMS = {SAMPLES: ("samples", SAMPLE_DTYPE), PREDICTIONS: ("predictions", PREDICTION_DTYPE)}
+WINDOW, GESTURE = 0, 1
+
+
+class SessionStore:
+    """Background writer for one store directory; see the module docstring."""
+
+    def __init__(self, root, roll_bytes=64 << 20, roll_s=3600, max_pending=100_000, flush_s=0.5):
+        self.root = root
+        self.roll_bytes = roll_bytes
+        self.roll_s = roll_s
+        self.max_pending = max_pending
+        self.flush_s = flush_s
+        self.written = 0
+        self.dropped = 0
+        self.bytes = 0
+        self.segments = 0
+        self._queue = deque()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._files = None
+        os.makedirs(root, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="session-store", daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return self._pending
+
+    def _put(self, item, count):
+        with self._lock:
+            if self._stopping or self._pending + count > self.max_pending:
+                self.dropped += count
+                return False
+            self._queue.append(item)
+            self._pending += count
+        return True
+
+    def add_samples(self, device_id, rows, received_at=None):
+        """Queue a device's ``(N, 9)`` sample rows; False if the store is behind and dropped them."""
+        received_at = time.time() if received_at is None else received_at
+        return self._put((SAMPLES, device_id, received_at, rows), len(rows))
+
+    def add_prediction(self, prediction, received_at=None):
+        received_at = time.time() if received_at is None else received_at
+        record = (received_at, prediction.timestamp, prediction.timestamp, prediction.confidence, WINDOW,
+                  str(prediction.label if prediction.label is not None else "").encode())
+        return self._put((PREDICTIONS, prediction.device_id, received_at, record), 1)
+
+    def add_gesture(self, event, received_at=None):
+        received_at = time.time() if received_at is None else received_at
+        record = (received_at, event.start, event.end, event.confidence, GESTURE, str(event.label).encode())
+        return self._put((PREDICTIONS, event.device_id, received_at, record), 1)
+
+    # --- Writer thread ---
+    def _open(self):
+        # Always a new segment, even after a crash left some files without an index
+        numbers = [int(name.split(".")[0]) for name in os.listdir(self.root) if name.split(".")[0].isdigit()]
+        number = max(numbers, default=0) + 1
+        base = os.path.join(self.root, f"{number:06d}")
+        self._paths = {stream: f"{base}.{name}" for stream, (name, _) in STREAMS.items()}
+        self._paths["index"] = f"{base}.index"
+        self._files = {key: open(path, "ab") for key, path in self._paths.items()}
+        self._offsets = {stream: 0 for stream in STREAMS}
+        self._entries = 0
+        self._opened = time.monotonic()
+        self.segments += 1
+
+    def _close(self):
+        if self._files is not None:
+            files, self._files = self._files, None
+            for f in files.values():
+                try:
+                    f.close()
+                except OSError as e:
+                    log.error("Session store could not close %s: %s", f.name, e)
+
+    def _rollback(self):
+        """Cut the segment back to its last complete write, or give it up if that fails too."""
+        self._close()
+        sizes = {stream: self._offsets[stream] * dtype.itemsize for stream, (_, dtype) in STREAMS.items()}
+        sizes["index"] = self._entries * INDEX_DTYPE.itemsize
+        try:
+            for key, path in self._paths.items():
+                os.truncate(path, sizes[key])
+            self._files = {key: open(path, "ab") for key, path in self._paths.items()}
+        except OSError as e:
+            # The next write starts a new segment; this one ends at its last indexed run
+            self._close()
+            log.error("Session store could not truncate segment %s: %s", self._paths["index"], e)
+
+    def _write(self, items):
+        if self._files is None or (self._offsets[SAMPLES] * SAMPLE_DTYPE.itemsize >= self.roll_bytes
+                                   or time.monotonic() - self._opened >= self.roll_s):
+            self._close()
+            self._open()
+        by_device = {}
+        for stream, device_id, received_at, payload in items:
+            by_device.setdefault((stream, device_id), []).append((received_at, payload))
+
+        # Build every record first, so a malformed item fails before anything is written
+        batches = []
+        for (stream, device_id), entries in by_device.items():
+            if stream == SAMPLES:
+                n = sum(len(rows) for _, rows in entries)
+                records = np.empty(n, SAMPLE_DTYPE)
+                at = 0
+                for received_at, rows in entries:
+                    rows = np.asarray(rows)
+                    records["received"][at:at + len(rows)] = received_at
+                    records["time"][at:at + len(rows)] = rows[:, 0]
+                    records["values"][at:at + len(rows)] = rows[:, 1:]
+                    at += len(rows)
+            else:
+                records = np.array([record for _, record in entries], PREDICTION_DTYPE)
+            batches.append((stream, device_id, records))
+
+        index = np.zeros(len(batches), INDEX_DTYPE)
+        offsets = dict(self._offsets)
+        try:
+            for i, (stream, device_id, records) in enumerate(batches):
+                self._files[stream].write(records.tobytes())
+                index[i] = (stream, device_id.encode(), records["received"].min(), records["received"].max(),
+                            offsets[stream], len(records))
+                offsets[stream] += len(records)
+            for stream in STREAMS:
+                self._files[stream].flush()
+            self._files["index"].write(index.tobytes())
+            self._files["index"].flush()
+        except OSError:
+            self._rollback()
+            raise
+        self._offsets = offsets
+        self._entries += len(index)
+        self.written += sum(len(records) for _, _, records in batches)
+        self.bytes += sum(records.nbytes for _, _, records in batches)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_s)
+            self._wakeup.clear()
+            with self._lock:
+                items, self._queue = self._queue, deque()
+                self._pending = 0
+                stopping = self._stopping
+            if items:
+                try:
+                    self._write(items)
+                except Exception as e:
+                    # Whatever failed, the thread keeps writing later batches
+                    self.dropped += sum(len(p) if s == SAMPLES else 1 for s, _, _, p in items)
+                    if isinstance(e, OSError):
+                        log.error("Session store write failed: %s", e)
+                    else:
+                        log.exception("Session store dropped a batch it could not write")
+            if stopping:
+                self._close()
+                return
+
+    def close(self, timeout_s=5.0):
+        """Write what is queued and close the files."""
+        with self._lock:
+            self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout_s)
+
+    def stats(self):
+        return {"pending": self._pending, "written": self.written, "dropped": self.dropped,
+                "bytes": self.bytes, "segments": self.segments}
+
+
+# --- Reading ---
+def read_index(root):
+    """All index entries, with the segment file each one belongs to."""
+    entries, segments = [], []
+    for path in sorted(glob.glob(os.path.join(root, "*.index"))):
+        index = np.fromfile(path, INDEX_DTYPE)
+        entries.append(index)
+        segments.extend([path[:-len(".index")]] * len(index))
+    index = np.concatenate(entries) if entries else np.empty(0, INDEX_DTYPE)
+    return index, np.array(segments, dtype=object)
+
+
+def devices(root):
+    index, _ = read_index(root)
+    return sorted({d.decode() for d in index["device"]})
+
+
+def read_range(root, device_id, start=None, end=None, stream=SAMPLES):
+    """Records of one device and stream with ``start <= received <= end`` (host seconds)."""
+    name, dtype = STREAMS[stream]
+    index, segments = read_index(root)
+    match = (index["stream"] == stream) & (index["device"] == device_id.encode())
+    if start is not None:
+        match &= index["t_max"] >= start
+    if end is not None:
+        match &= index["t_min"] <= end
+    parts = []
+    for entry, segment in zip(index[match], segments[match]):
+        data = np.memmap(f"{segment}.{name}", dtype, mode="r", offset=int(entry["offset"]) * dtype.itemsize,
+                         shape=(int(entry["count"]),))
+        keep = np.ones(len(data), dtype=bool)
+        if start is not None:
+            keep &= data["received"] >= start
+        if end is not None:
+            keep &= data["received"] <= end
+        parts.append(np.array(data[keep]))
+    return np.concatenate(parts) if parts else np.empty(0, dtype)
+
+
+def read_samples(root, device_id, start=None, end=None):
+    """``(received, rows)`` for one device, rows in the usual ``(N, 9)`` layout."""
+    records = read_range(root, device_id, start, end, SAMPLES)
+    rows = np.column_stack([records["time"], records["values"].astype(np.float64)])
+    return records["received"], rows.reshape(-1, N_COLUMNS)
+
+
+def read_predictions(root, device_id, start=None, end=None):
+    return read_range(root, device_id, start, end, PREDICTIONS)
+
+
+# --- Command line ---
+def bench(args):
+    import shutil
+    import tempfile
+
+    from .recording import synthetic_recording
+
+    recording = synthetic_recording(args.seconds, 100, args.devices)
+    # One message per device per 100 ms, like a glove batching 10 samples per frame
+    blocks = []
+    for index, device_id in enumerate(recording.devices):
+        rows = recording.samples[recording.device == index]
+        blocks.extend((lo, device_id, rows[lo:lo + 10]) for lo in range(0, len(rows), 10))
+    blocks.sort(key=lambda b: b[0])
+
+    root = args.root or tempfile.mkdtemp(prefix="emg-store-")
+    try:
+        store = SessionStore(root, roll_bytes=args.roll_mb << 20, max_pending=len(recording.samples))
+        started = time.perf_counter()
+        wall = time.time()
+        for i, (_, device_id, rows) in enumerate(blocks):
+            store.add_samples(device_id, rows, wall + i * 1e-4)
+        enqueue_s = time.perf_counter() - started
+        store.close(timeout_s=600)
+        total_s = time.perf_counter() - started
+        stats = store.stats()
+        ingest = args.devices * 100
+        print(f"{stats['written']} samples from {args.devices} devices ({args.seconds:.0f}s each), "
+              f"{stats['bytes'] / 1e6:.1f} MB in {stats['segments']} segment(s)")
+        print(f"enqueue  {enqueue_s / len(blocks) * 1e6:6.2f} us per message on the ingest thread")
+        print(f"write    {stats['written'] / total_s:10.0f} samples/s  {stats['bytes'] / 1e6 / total_s:6.1f} MB/s  "
+              f"= {stats['written'] / total_s / ingest:.0f}x the live ingest rate ({ingest} samples/s)")
+        device_id = recording.devices[0]
+        middle = wall + len(blocks) * 1e-4 / 2
+        started = time.perf_counter()
+        received, rows = read_samples(root, device_id, middle, middle + len(blocks) * 1e-4 / 10)
+        print(f"read     {len(rows)} samples of {device_id} from a 10% range in "
+              f"{(time.perf_counter() - started) * 1e3:.1f} ms")
+    finally:
+        if not args.root:
+            shutil.rmtree(root)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Session store benchmark and range reads.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    b = commands.add_parser("bench", help="measure write throughput against the ingest rate")
+    b.add_argument("--devices", type=int, default=16)
+    b.add_argument("--seconds", type=float, default=60, help="synthetic session length per device")
+    b.add_argument("--roll-mb", type=int, default=64)
+    b.add_argument("--root", help="keep the store here (default: a temporary directory)")
+    r = commands.add_parser("read", help="print one device's samples or predictions in a time range")
+    r.add_argument("root")
+    r.add_argument("device")
+    r.add_argument("--start", type=float, help="host time, seconds since the epoch")
+    r.add_argument("--end", type=float)
+    r.add_argument("--predictions", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        bench(args)
+    elif args.predictions:
+        for record in read_predictions(args.root, args.device, args.start, args.end):
+            print(f"{record['received']:.3f}  {record['start']:.0f}-{record['end']:.0f} ms  "
+                  f"{record['label'].decode() or '-'}  {record['confidence']:.3f}")
+    else:
+        received, rows = read_samples(args.root, args.device, args.start, args.end)
+        for t, row in zip(received, rows):
+            print(f"{t:.3f}  " + " ".join(f"{v:g}" for v in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Opt-in binary telemetry for WebSocket clients: predictions, confidences, raw channels, features.
+
+A client asks for it with a JSON message::
+
+    {"telemetry": {"streams": ["predictions", "raw"], "rate_hz": 10, "raw_hz": 50}}
+
+and gets back a JSON hello ``{"telemetry": {"labels": [...], "channels":
+[...], "features": [...], "devices": {"glove1": 0}, ...}}``; devices seen
+later are announced the same way. ``{"telemetry": null}`` stops it. The
+existing JSON prediction messages are unaffected.
+
+From then on the client receives binary messages, at most ``rate_hz`` a
+second, each holding one or more frames back to back. A frame (all
+little-endian) is::
+
+    header  20 bytes  magic "ET", uint8 version, uint8 stream,
+                      uint16 device, uint16 count, uint16 width, 2 pad,
+                      float64 t0 (device ms)
+    times   float32[count]          ms since t0
+    values  float32[count * width]  row-major
+    labels  uint16[count]           predictions only, padded to 4 bytes
+
+so every array starts 4-byte aligned and maps onto a JS typed array
+without copying. ``predictions`` carries the confidence as its one value
+column and the label as an index into ``labels`` (65535: under the
+confidence threshold); ``confidences`` has one column per label, ``raw``
+one per channel and ``features`` one per feature name. ``raw`` carries
+the samples as the devices sent them, averaged over ``1000 / raw_hz`` ms
+buckets of device time when ``raw_hz`` is given: a glove slower than
+``raw_hz`` arrives at its own rate, and the frame times are the real ones.
+
+The hub buffers what the pipeline produces and, on every tick, encodes
+each device's new data once per stream (raw once per bucket size in
+use) and hands the same bytes to every client that wants them, so the
+encoding work does not grow with the number of clients.
+"""
+import asyncio
+import json
+import logging
+import struct
+import time
+from collections import deque
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"ET"
+VERSION = 1
+HEADER = struct.Struct("<2sBBHHHxxd")
+PREDICTIONS, CONFIDENCES, RAW, FEATURES = 1, 2, 3, 4
+STREAMS = {"predictions": PREDICTIONS, "confidences": CONFIDENCES, "raw": RAW, "features": FEATURES}
+NO_LABEL = 0xFFFF
+
+
+def encode_frame(stream, device, times, values, labels=None):
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype="<f4").reshape(len(times), -1)
+    t0 = float(times[0]) if len(times) else 0.0
+    parts = [HEADER.pack(MAGIC, VERSION, stream, device, len(times), values.shape[1], t0),
+             (times - t0).astype("<f4").tobytes(), values.tobytes()]
+    if labels is not None:
+        parts.append(np.asarray(labels, dtype="<u2").tobytes())
+        if len(times) % 2:
+            parts.append(b"\0\0")
+    return b"".join(parts)
+
+
+def decode_frames(data):
+    """Split a telemetry message into ``(stream, device, times, values, labels)`` tuples."""
+    frames, offset = [], 0
+    while offset < len(data):
+        magic, version, stream, device, count, width, t0 = HEADER.unpack_from(data, offset)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a telemetry frame at byte {offset}")
+        offset += HEADER.size
+        times = t0 + np.frombuffer(data, "<f4", count, offset).astype(np.float64)
+        offset += 4 * count
+        values = np.frombuffer(data, "<f4", count * width, offset).reshape(count, width)
+        offset += 4 * count * width
+        labels = None
+        if stream == PREDICTIONS:
+            labels = np.frombuffer(data, "<u2", count, offset)
+            offset += 2 * count + (2 if count % 2 else 0)
+        frames.append((stream, device, times, values, labels))
+    return frames
+
+
+class TelemetryClient:
+    """What one connection asked for, and the frames waiting for its next send."""
+
+    def __init__(self, streams, bucket_ms, interval_s):
+        self.streams = streams
+        self.bucket_ms = bucket_ms
+        self.interval_s = interval_s
+        self.next_send = 0.0
+        self.batch = []
+
+
+class TelemetryHub:
+    """Collects telemetry from any thread and sends it from the event loop.
+
+    ``add_samples`` and ``add_prediction`` only append to a deque and
+    ``wants_raw`` is a plain flag, so the ingest and inference threads can
+    use them directly; ``run()`` drains the deque every ``tick_ms`` on the
+    loop. Clients are the broadcaster's, and their device subscriptions
+    apply here too. Raw samples are averaged
+    per bucket of device time; the newest bucket waits for the next tick
+    in case more of its samples arrive. It is forgotten once its device
+    has sent nothing for ``idle_timeout_s``, or no client asks for that
+    rate any more.
+    """
+
+    def __init__(self, broadcaster, tick_ms=50, channels=(), features=(), max_pending=10_000, metrics=None,
+                 idle_timeout_s=60):
+        self.broadcaster = broadcaster
+        self.tick_s = tick_ms / 1000.0
+        self.channels = list(channels)
+        self.features = list(features)
+        self.labels = []
+        self.metrics = metrics
+        self.idle_timeout_s = idle_timeout_s
+        self.clients = {}
+        # Read by the producers; only the loop thread, which owns clients, writes it
+        self.wants_raw = False
+        self.frames = 0
+        self.bytes = 0
+        self._inbox = deque(maxlen=max_pending)
+        self._devices = {}
+        self._carry = {}     # (device_id, bucket_ms) -> rows of the bucket still filling
+        self._raw_seen = {}  # device_id -> monotonic time of its last raw samples
+        self._next_sweep = 0.0
+
+    def __len__(self):
+        return len(self.clients)
+
+    def _clients_changed(self):
+        self.wants_raw = any(RAW in c.streams for c in self.clients.values())
+
+    # --- Producer side, any thread ---
+    def add_samples(self, device_id, rows):
+        self._inbox.append((RAW, device_id, rows))
+
+    def add_prediction(self, prediction):
+        self._inbox.append((PREDICTIONS, prediction.device_id, prediction))
+
+    # --- Event loop side ---
+    def _hello(self, **extra):
+        return json.dumps({"telemetry": dict(extra, version=VERSION, labels=self.labels,
+                                             channels=self.channels, features=self.features,
+                                             streams=STREAMS, devices=self._devices)})
+
+    def _send(self, websocket, message):
+        self.broadcaster.send(websocket, message)
+
+    def subscribe(self, websocket, spec):
+        """Apply a client's ``{"telemetry": spec}`` request; None unsubscribes."""
+        if spec is None:
+            self.unsubscribe(websocket)
+            return
+        try:
+            streams = {STREAMS[name] for name in spec.get("streams", ["predictions"])}
+            rate_hz = min(float(spec.get("rate_hz", 10)), 1.0 / self.tick_s)
+            raw_hz = spec.get("raw_hz")
+            if raw_hz is not None:
+                raw_hz = float(raw_hz)
+            if rate_hz <= 0 or (raw_hz is not None and raw_hz <= 0):
+                raise ValueError("rates must be positive")
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            self._send(websocket, json.dumps({"error": f"Bad telemetry request: {e}"}))
+            return
+        bucket_ms = 1000.0 / raw_hz if raw_hz is not None else 0.0
+        self.clients[websocket] = TelemetryClient(streams, bucket_ms, 1.0 / rate_hz)
+        self._clients_changed()
+        # raw_hz is an upper bound: each device's raw rate is whatever it sends, up to this
+        self._send(websocket, self._hello(rate_hz=rate_hz, raw_hz=raw_hz))
+
+    def unsubscribe(self, websocket):
+        if self.clients.pop(websocket, None) is not None:
+            self._clients_changed()
+
+    def _device(self, device_id):
+        number = self._devices.get(device_id)
+        if number is None:
+            number = self._devices[device_id] = len(self._devices)
+            announcement = json.dumps({"telemetry": {"devices": {device_id: number}}})
+            for websocket in self.clients:
+                self._send(websocket, announcement)
+        return number
+
+    def _decimate(self, device_id, bucket_ms, rows):
+        """Average ``rows`` (time first) over ``bucket_ms`` buckets of device time."""
+        if not bucket_ms:
+            return rows
+        carry = self._carry.get((device_id, bucket_ms))
+        if carry is not None and rows[0, 0] >= carry[-1, 0]:
+            rows = np.concatenate([carry, rows])
+        buckets = np.floor(rows[:, 0] / bucket_ms)
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        # The newest bucket may still be filling
+        last = starts[-1]
+        self._carry[(device_id, bucket_ms)] = rows[last:]
+        if last == 0:
+            return rows[:0]
+        counts = np.diff(starts)
+        return np.add.reduceat(rows[:last], starts[:-1], axis=0) / counts[:, None]
+
+    def _forget_carry(self, now):
+        """Drop the carried buckets of idle devices and of rates no client asks for."""
+        self._next_sweep = now + self.idle_timeout_s / 4
+        idle = {d for d, seen in self._raw_seen.items() if now - seen >= self.idle_timeout_s}
+        for device_id in idle:
+            del self._raw_seen[device_id]
+        buckets = {c.bucket_ms for c in self.clients.values() if RAW in c.streams}
+        for key in [k for k in self._carry if k[0] in idle or k[1] not in buckets]:
+            del self._carry[key]
+
+    def _encode(self, raw, windows):
+        """``{(device_id, stream, bucket_ms): frame bytes}`` for this tick's data, each encoded once."""
+        buckets = {c.bucket_ms for c in self.clients.values() if RAW in c.streams}
+        wanted = set().union(*(c.streams for c in self.clients.values()))
+        frames = {}
+        for device_id, blocks in raw.items():
+            rows = np.concatenate(blocks)
+            for bucket_ms in buckets:
+                decimated = self._decimate(device_id, bucket_ms, rows)
+                if len(decimated):
+                    frames[(device_id, RAW, bucket_ms)] = encode_frame(
+                        RAW, self._device(device_id), decimated[:, 0], decimated[:, 1:])
+        label_ids = {label: i for i, label in enumerate(self.labels)}
+        for device_id, predictions in windows.items():
+            number = self._device(device_id)
+            times = [p.timestamp for p in predictions]
+            if PREDICTIONS in wanted:
+                labels = [label_ids.get(str(p.label), NO_LABEL) if p.label is not None else NO_LABEL
+                          for p in predictions]
+                frames[(device_id, PREDICTIONS, None)] = encode_frame(
+                    PREDICTIONS, number, times, [p.confidence for p in predictions], labels)
+            if CONFIDENCES in wanted and all(p.probs is not None for p in predictions):
+                frames[(device_id, CONFIDENCES, None)] = encode_frame(
+                    CONFIDENCES, number, times, np.vstack([p.probs for p in predictions]))
+            if FEATURES in wanted and all(p.features is not None for p in predictions):
+                frames[(device_id, FEATURES, None)] = encode_frame(
+                    FEATURES, number, times, np.vstack([p.features for p in predictions]))
+        return frames
+
+    def tick(self, now=None):
+        now = time.monotonic() if now is None else now
+        raw, windows = {}, {}
+        while self._inbox:
+            stream, device_id, item = self._inbox.popleft()
+            if stream == RAW:
+                raw.setdefault(device_id, []).append(np.asarray(item, dtype=np.float64))
+                self._raw_seen[device_id] = now
+            else:
+                windows.setdefault(device_id, []).append(item)
+        if now >= self._next_sweep:
+            self._forget_carry(now)
+        if not self.clients:
+            return
+        frames = self._encode(raw, windows)
+        self.frames += len(frames)
+        self.bytes += sum(len(f) for f in frames.values())
+
+        for websocket, client in list(self.clients.items()):
+            queue = self.broadcaster.clients.get(websocket)
+            if queue is None:
+                del self.clients[websocket]
+                self._clients_changed()
+                continue
+            for (device_id, stream, bucket_ms), frame in frames.items():
+                if stream in client.streams and bucket_ms in (None, client.bucket_ms) and queue.wants(device_id):
+                    client.batch.append(frame)
+            if client.batch and now >= client.next_send:
+                self.broadcaster.send(websocket, b"".join(client.batch))
+                client.batch = []
+                client.next_send = now + client.interval_s
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.tick_s)
+            started = time.perf_counter()
+            try:
+                self.tick()
+            except Exception:
+                log.exception("Telemetry tick failed")
+            if self.metrics is not None:
+                self.metrics.record("telemetry_tick", time.perf_counter() - started)
@@ -0,0 +1,257 @@
+"""Offline training: recordings -> windowed feature dataset -> fitted, exported model.
+
+    python -m emg_engine.training recordings/ --out model.pkl --flat model_flat
+
+Each recording is resampled onto the same fixed-rate grid as the apps
+(``SAMPLE_RATE``), cut into the same sub-windows they score
+(``SUB_WINDOW_MS`` long, ``SUB_WINDOW_MS - OVERLAP_MS`` apart) and
+featurized with the batch feature code, one recording per process. Those
+settings come from the active profile (``load_config()``, so EMG_PROFILE,
+EMG_CONFIG and EMG_<SETTING> apply here as they do to the apps), and the
+command line flags override them. The
+rows are cached per recording under ``cache_dir/<config hash>/`` with
+one array per column, so a re-run only featurizes recordings that are
+new or have changed.
+
+A recording's label is the one it was recorded with, or else the name of
+the directory it sits in (``recordings/thank/session1.npz``).
+"""
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .batch import window_features_batch
+from .config import GLOVE_SENSORS, load_config
+from .features import feature_names
+from .protocol import JSON_FIELDS
+from .recording import load_recording
+from .resample import resample
+
+SENSORS = JSON_FIELDS[1:]
+# Bump when the feature code changes what it computes, to invalidate caches
+CACHE_VERSION = 1
+
+# channels are indices into SENSORS; None uses all eight. rate_hz None keeps the raw samples
+FeatureConfig = namedtuple("FeatureConfig",
+                           ["window_ms", "step_ms", "features", "channels", "rate_hz", "max_gap_ms"])
+Dataset = namedtuple("Dataset", ["X", "y", "names", "source", "device", "start"])
+
+
+def feature_config(settings=None, **overrides):
+    """The windows the apps score, from ``load_config()`` settings; ``overrides`` replace fields."""
+    s = load_config() if settings is None else settings
+    # The app names the recordings' columns GLOVE_SENSORS
+    if list(s["SENSORS"]) == GLOVE_SENSORS:
+        channels = None
+    elif set(s["SENSORS"]) <= set(GLOVE_SENSORS):
+        channels = tuple(GLOVE_SENSORS.index(name) for name in s["SENSORS"])
+    else:
+        # e.g. the single profile's "emg": the first channels of the recordings
+        channels = tuple(range(len(s["SENSORS"])))
+    config = FeatureConfig(s["SUB_WINDOW_MS"], s["SUB_WINDOW_MS"] - s["OVERLAP_MS"], tuple(s["FEATURES"]),
+                           channels, s["SAMPLE_RATE"] if s["RESAMPLE"] else None, s["MAX_GAP_MS"])
+    return config._replace(**overrides)
+
+
+def config_hash(config):
+    spec = dict(config._asdict(), features=list(config.features), version=CACHE_VERSION)
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def column_names(config):
+    channels = range(len(SENSORS)) if config.channels is None else config.channels
+    return feature_names([SENSORS[c] for c in channels], config.features)
+
+
+def expand_paths(paths):
+    """Recording files named directly or found (recursively) in directories."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                found.extend(os.path.join(root, f) for f in files if f.endswith(".npz"))
+        else:
+            found.append(path)
+    return sorted(found)
+
+
+def cache_file(cache_dir, config, path):
+    """Where the rows of ``path`` live; the name changes whenever the file does."""
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, config_hash(config), f"{stem}-{digest}.npz")
+
+
+def featurize_recording(path, config):
+    """Feature rows for every device in one recording, as a dict of columns."""
+    recording = load_recording(path)
+    label = recording.label or os.path.basename(os.path.dirname(os.path.abspath(path)))
+    values = recording.samples[:, 1:]
+    if config.channels is not None:
+        values = values[:, list(config.channels)]
+    starts, blocks, devices = [], [], []
+    for index, device_id in enumerate(recording.devices):
+        rows = np.flatnonzero(recording.device == index)
+        rows = rows[np.argsort(recording.samples[rows, 0], kind="stable")]
+        times, device_values = recording.samples[rows, 0], values[rows]
+        if config.rate_hz:
+            times, device_values, _ = resample(times, device_values, config.rate_hz, config.max_gap_ms)
+        s, X = window_features_batch(times, device_values, config.window_ms, config.step_ms,
+                                     config.features)
+        starts.append(s)
+        blocks.append(X)
+        devices.append(np.full(len(s), device_id))
+    names = column_names(config)
+    X = np.concatenate(blocks) if blocks else np.empty((0, len(names)), np.float32)
+    columns = {name: X[:, i] for i, name in enumerate(names)}
+    columns["start"] = np.concatenate(starts) if starts else np.empty(0)
+    columns["device"] = np.concatenate(devices).astype(str) if devices else np.empty(0, str)
+    columns["label"] = np.array(label)
+    return columns
+
+
+def _build(task):
+    path, config, target = task
+    columns = featurize_recording(path, config)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # Write then rename, so an interrupted run never leaves a half-written entry
+    partial = target + ".partial.npz"
+    np.savez(partial, **columns)
+    os.replace(partial, target)
+    return len(columns["start"])
+
+
+def build_dataset(paths, config=None, cache_dir=".feature_cache", workers=None):
+    """Featurize ``paths`` (files or directories), reusing cached rows.
+
+    ``config`` defaults to ``feature_config()``. Returns ``(dataset, stats)``;
+    recordings missing from the cache are featurized across ``workers``
+    processes (default: one per CPU).
+    """
+    config = feature_config() if config is None else config
+    files = expand_paths(paths)
+    targets = [cache_file(cache_dir, config, path) for path in files]
+    missing = [(path, config, target) for path, target in zip(files, targets)
+               if not os.path.exists(target)]
+
+    started = time.perf_counter()
+    if len(missing) > 1 and workers != 1:
+        with ProcessPoolExecutor(workers) as pool:
+            list(pool.map(_build, missing))
+    else:
+        for task in missing:
+            _build(task)
+    featurize_s = time.perf_counter() - started
+
+    names = column_names(config)
+    blocks, labels, sources, devices, starts = [], [], [], [], []
+    for path, target in zip(files, targets):
+        with np.load(target) as data:
+            n = len(data["start"])
+            blocks.append(np.column_stack([data[name] for name in names]) if n
+                          else np.empty((0, len(names)), np.float32))
+            labels.append(np.full(n, str(data["label"]), dtype=object))
+            sources.append(np.full(n, path, dtype=object))
+            devices.append(data["device"].astype(object))
+            starts.append(data["start"])
+    empty = np.empty(0, dtype=object)
+    dataset = Dataset(
+        X=np.concatenate(blocks) if blocks else np.empty((0, len(names)), np.float32),
+        y=np.concatenate(labels) if labels else empty,
+        names=names,
+        source=np.concatenate(sources) if sources else empty,
+        device=np.concatenate(devices) if devices else empty,
+        start=np.concatenate(starts) if starts else np.empty(0),
+    )
+    stats = {"recordings": len(files), "featurized": len(missing), "cached": len(files) - len(missing),
+             "rows": len(dataset.X), "featurize_s": featurize_s, "total_s": time.perf_counter() - started}
+    return dataset, stats
+
+
+def split_by_recording(dataset, test_size=0.2, seed=0):
+    """Boolean test mask holding out whole recordings, so windows of one session never straddle the split."""
+    sources = np.unique(dataset.source)
+    rng = np.random.default_rng(seed)
+    n_test = int(round(len(sources) * test_size))
+    held_out = rng.choice(sources, size=n_test, replace=False) if n_test else []
+    return np.isin(dataset.source, held_out)
+
+
+def fit_model(X, y, n_estimators=100, max_depth=None, seed=0):
+    from sklearn.ensemble import RandomForestClassifier
+
+    model = RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth,
+                                   random_state=seed, n_jobs=-1)
+    return model.fit(X, y)
+
+
+def export_model(model, path=None, flat_path=None):
+    """Write the pickle the apps load and/or the flat forest they memory-map."""
+    if path:
+        import joblib
+        joblib.dump(model, path)
+    if flat_path:
+        from .backends import FlatForestBackend
+        FlatForestBackend.from_sklearn(model).save(flat_path, source=path)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the windowed feature dataset and train the classifier.")
+    parser.add_argument("paths", nargs="+", help="recording .npz files or directories of them")
+    parser.add_argument("--cache", default=".feature_cache", help="feature cache directory")
+    parser.add_argument("--workers", type=int, default=None, help="featurizing processes (default: CPUs)")
+    parser.add_argument("--profile", help="settings profile the windows come from (default: EMG_PROFILE or glove)")
+    parser.add_argument("--window-ms", type=float, help="sub-window length (default: SUB_WINDOW_MS)")
+    parser.add_argument("--step-ms", type=float, help="hop (default: SUB_WINDOW_MS - OVERLAP_MS)")
+    parser.add_argument("--features", help="per-channel features, in model order (default: FEATURES)")
+    parser.add_argument("--channels", help="comma-separated sensor indices, e.g. 0 for emg1 only (default: SENSORS)")
+    parser.add_argument("--rate-hz", type=float, help="resampling grid, 0 keeps raw samples (default: SAMPLE_RATE)")
+    parser.add_argument("--max-gap-ms", type=float, help="gaps not interpolated over (default: MAX_GAP_MS)")
+    parser.add_argument("--estimators", type=int, default=100)
+    parser.add_argument("--max-depth", type=int, default=None)
+    parser.add_argument("--test-size", type=float, default=0.2, help="fraction of recordings held out")
+    parser.add_argument("--out", help="write the fitted model here (joblib pickle)")
+    parser.add_argument("--flat", help="also write the flattened forest to this directory")
+    args = parser.parse_args(argv)
+
+    settings = load_config(environ=dict(os.environ, EMG_PROFILE=args.profile) if args.profile else None)
+    overrides = {"window_ms": args.window_ms, "step_ms": args.step_ms, "max_gap_ms": args.max_gap_ms,
+                 "features": tuple(args.features.split(",")) if args.features else None,
+                 "channels": tuple(int(c) for c in args.channels.split(",")) if args.channels else None,
+                 "rate_hz": args.rate_hz}
+    config = feature_config(settings, **{k: v for k, v in overrides.items() if v is not None})
+    config = config._replace(rate_hz=config.rate_hz or None)
+    print(f"{settings['PROFILE']} profile: {config}")
+    dataset, stats = build_dataset(args.paths, config, args.cache, args.workers)
+    print(f"{stats['recordings']} recordings ({stats['cached']} cached, {stats['featurized']} featurized) "
+          f"-> {stats['rows']} windows x {len(dataset.names)} features in {stats['total_s']:.2f}s")
+    if len(dataset.X) == 0:
+        raise SystemExit("No windows to train on")
+
+    test = split_by_recording(dataset, args.test_size)
+    if test.any() and (~test).any():
+        started = time.perf_counter()
+        model = fit_model(dataset.X[~test], dataset.y[~test], args.estimators, args.max_depth)
+        accuracy = float(np.mean(model.predict(dataset.X[test]) == dataset.y[test]))
+        print(f"held-out accuracy {accuracy:.3f} on {int(test.sum())} windows "
+              f"(fit {time.perf_counter() - started:.2f}s)")
+
+    # The exported model is refit on everything
+    started = time.perf_counter()
+    model = fit_model(dataset.X, dataset.y, args.estimators, args.max_depth)
+    print(f"fit on {len(dataset.X)} windows in {time.perf_counter() - started:.2f}s, "
+          f"classes {list(model.classes_)}")
+    export_model(model, args.out, args.flat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import logging
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+
+
+class SampleQueue:
+    """Bounded hand-off queue between the MQTT network thread and inference.
+
+    When the queue is full, ``drop_oldest`` discards the oldest queued sample
+    (stale data is worthless for live prediction), ``drop_newest`` discards
+    the incoming one, and ``block`` makes the producer wait, which pushes the
+    backlog back onto the broker. Every discarded sample is counted in
+    ``dropped``.
+    """
+
+    def __init__(self, maxsize=1024, policy=DROP_OLDEST):
+        if policy not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.enqueued = 0
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        """Queue an item; returns False if it (or nothing) could be queued."""
+        with self._cond:
+            if self._closed:
+                return False
+            if len(self._items) >= self.maxsize:
+                if self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                if self.policy == DROP_OLDEST:
+                    self._items.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._items) >= self.maxsize and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        return False
+            self._items.append(item)
+            self.enqueued += 1
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Next item, or None once the queue is closed or the timeout passes."""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class InferenceWorker(threading.Thread):
+    """Consumes samples from a SampleQueue and runs ``handler`` on each one.
+
+    Feature extraction and ``predict_proba`` run here, so a slow prediction
+    only grows the queue instead of stalling the MQTT socket reads.
+    ``tick``, if given, is called between samples and returns how many
+    seconds may pass before it must be called again (None: no hurry),
+    e.g. ``Pipeline.poll`` to flush a micro-batch on its deadline.
+    """
+
+    def __init__(self, queue, handler, name="inference-worker", tick=None):
+        super().__init__(name=name, daemon=True)
+        self.queue = queue
+        self.handler = handler
+        self.tick = tick
+        self.processed = 0
+        self.errors = 0
+        self._stopping = threading.Event()
+        self._drain_until = 0.0
+
+    def run(self):
+        while not self._stopping.is_set() or (len(self.queue) and time.monotonic() < self._drain_until):
+            timeout = 0.5
+            if self.tick is not None:
+                try:
+                    due = self.tick()
+                except Exception:
+                    due = None
+                    log.exception("Inference worker tick failed")
+                if due is not None:
+                    timeout = min(timeout, due)
+            item = self.queue.get(timeout=timeout)
+            if item is None:
+                continue
+            try:
+                self.handler(item)
+            except Exception:
+                self.errors += 1
+                log.exception("Inference worker failed on a sample")
+            self.processed += 1
+
+    def stop(self, drain_s=0.0):
+        """Stop taking samples; what is already queued is still handled for up to ``drain_s``."""
+        self._drain_until = time.monotonic() + drain_s
+        self.queue.close()
+        self._stopping.set()
+
+    def stats(self):
+        return {
+            "queued": len(self.queue),
+            "enqueued": self.queue.enqueued,
+            "dropped": self.queue.dropped,
+            "processed": self.processed,
+            "errors": self.errors,
+        }
@@ -1,92 +1,181 @@
-import random
-import joblib
+import time
+STARTED_AT = time.perf_counter()  # cold start is measured from here
 import asyncio
-import websockets
 from aiohttp import web
-import time
 import numpy as np
 import json
+import logging
 import threading
-import paho.mqtt.client as mqtt
 import os
-import pandas as pd
 from collections import deque
 from threading import Lock
-
-
-# Settings
-PORT = 8000
-WS_PORT = 8765
-MQTT_BROKER = "192.168.43.242" # Replace with your MQTT broker address
-TOPIC = "esp32/emg"  # Replace with your MQTT topic
-MAIN_WINDOW_MS = 4000        # 4-second buffer
-SUB_WINDOW_MS = 500          # 500 ms subwindow
-OVERLAP_MS = 250             # 250 ms overlap
-SAMPLE_RATE = 100            # approx samples per second
-buffer = []
-
-connected_clients = set()
-data_queue = asyncio.Queue()
-
-# --- Serve index.html from /static ---
-async def index(request):
-    print("Serving index.html")  # Debug
-    return web.FileResponse('./static/index.html')
-
-# In app.py, modify the start_http_server function:
-def start_http_server():
+from urllib.parse import urlparse, parse_qs
+from emg_engine.batch import predict_windows
+from emg_engine.worker import SampleQueue, InferenceWorker
+from emg_engine.config import build_pipeline, load_config
+from emg_engine.recording import Recorder
+from emg_engine.metrics import METRICS
+from emg_engine.logs import setup_logging
+from emg_engine.backends import FlatForestBackend, load_backend
+from emg_engine.broadcast import Broadcaster
+from emg_engine.resample import DUPLICATE, GAP, OUT_OF_ORDER, RESTART
+from emg_engine.pool import InferencePool
+from emg_engine.storage import SessionStore
+from emg_engine.telemetry import TelemetryHub
+from emg_engine.features import feature_names
+# pandas, joblib, websockets and paho are imported where they are used, so
+# the ports open without paying for them (or for sklearn) on startup
+
+
+log = logging.getLogger("final_app")
+
+# Settings: every one is listed with its default in emg_engine.config. This
+# is the "glove" profile; EMG_PROFILE, EMG_CONFIG (a JSON file of settings)
+# and EMG_<SETTING> environment variables override it, e.g.
+# EMG_MQTT_BROKER=10.0.0.5 when Mosquitto is not on this machine
+CONFIG = load_config("glove")
+PROFILE = CONFIG["PROFILE"]
+PORT = CONFIG["PORT"]
+WS_PORT = CONFIG["WS_PORT"]
+UNIFIED_SERVER = CONFIG["UNIFIED_SERVER"]
+STATIC_DIR = CONFIG["STATIC_DIR"]
+MQTT_BROKER = CONFIG["MQTT_BROKER"]
+MQTT_PORT = CONFIG["MQTT_PORT"]
+TOPIC = CONFIG["TOPIC"]
+SENSORS = CONFIG["SENSORS"]
+FEATURES = CONFIG["FEATURES"]
+SUB_WINDOW_MS = CONFIG["SUB_WINDOW_MS"]
+OVERLAP_MS = CONFIG["OVERLAP_MS"]
+SMOOTHING = CONFIG["SMOOTHING"]
+SAMPLE_QUEUE_SIZE = CONFIG["SAMPLE_QUEUE_SIZE"]
+QUEUE_POLICY = CONFIG["QUEUE_POLICY"]
+INFERENCE_WORKERS = CONFIG["INFERENCE_WORKERS"]
+POOL_RING_SIZE = CONFIG["POOL_RING_SIZE"]
+IDLE_SESSION_S = CONFIG["IDLE_SESSION_S"]
+MODEL_PATH = CONFIG["MODEL_PATH"]
+FLAT_MODEL_PATH = CONFIG["FLAT_MODEL_PATH"]
+MODEL_BACKEND = CONFIG["MODEL_BACKEND"]
+LOG_LEVEL = CONFIG["LOG_LEVEL"]
+CLIENT_QUEUE_SIZE = CONFIG["CLIENT_QUEUE_SIZE"]
+CLIENT_STALL_S = CONFIG["CLIENT_STALL_S"]
+TELEMETRY_TICK_MS = CONFIG["TELEMETRY_TICK_MS"]
+RECORD_PATH = CONFIG["RECORD_PATH"]
+STORE_DIR = CONFIG["STORE_DIR"]
+STORE_ROLL_MB = CONFIG["STORE_ROLL_MB"]
+STORE_ROLL_S = CONFIG["STORE_ROLL_S"]
+
+setup_logging(LOG_LEVEL)
+log.info("Using the %s profile", PROFILE)
+recorder = Recorder(RECORD_PATH) if RECORD_PATH else None
+store = None  # the SessionStore when STORE_DIR is set, opened on start
+
+broadcaster = Broadcaster(CLIENT_QUEUE_SIZE, CLIENT_STALL_S, metrics=METRICS)
+telemetry = TelemetryHub(broadcaster, TELEMETRY_TICK_MS, channels=SENSORS,
+                         features=feature_names(SENSORS, FEATURES), metrics=METRICS,
+                         idle_timeout_s=IDLE_SESSION_S)
+
+# --- Serve index.html from STATIC_DIR ---
+def create_web_app(unified=False):
     app = web.Application()
     
     # Get absolute path to static folder
     import os
     current_dir = os.path.dirname(os.path.abspath(__file__))
-    static_path = os.path.join(current_dir, 'static')
-    
-    # Verify index.html exists
-    if not os.path.exists(os.path.join(static_path, 'index.html')):
-        print(f"Error: index.html not found at {static_path}")
-        exit(1)
+    static_path = os.path.join(current_dir, STATIC_DIR)
     
-    app.router.add_get('/', lambda r: web.FileResponse(os.path.join(static_path, 'index.html')))
-    app.router.add_static('/static/', path=static_path)
-    
-    print(f"Serving from {static_path}")
-    web.run_app(app, port=PORT)
+    # Without the page, MQTT, /ws, /metrics and /healthz are still worth serving
+    if os.path.exists(os.path.join(static_path, 'index.html')):
+        app.router.add_get('/', lambda r: web.FileResponse(os.path.join(static_path, 'index.html')))
+        app.router.add_static('/static/', path=static_path)
+        log.info("Serving from %s", static_path)
+    else:
+        log.warning("index.html not found at %s, serving no page", static_path)
+    app.router.add_get('/metrics', lambda r: web.json_response(METRICS.snapshot()))
+    app.router.add_get('/healthz', healthz)
+    if unified:
+        app.router.add_get('/ws', ws_route)
+        app.on_startup.append(start_background)
+        app.on_shutdown.append(close_clients)
+        app.on_cleanup.append(stop_background)
+    return app
+
+async def healthz(request):
+    """200 once the model is loaded, 503 while it is loading or if it failed."""
+    body = dict(model_state)
+    body["uptime_s"] = time.perf_counter() - STARTED_AT
+    return web.json_response(body, status=200 if body["status"] == "ready" else 503)
+
+def start_http_server():
+    web.run_app(create_web_app(), port=PORT)
 
 # --- WebSocket Handler ---
+def requested_devices(websocket):
+    """Devices named in the connection URL, e.g. ws://host:8765/?device=glove1&device=glove2"""
+    request = getattr(websocket, "request", None)
+    path = request.path if request is not None else getattr(websocket, "path", "")
+    devices = parse_qs(urlparse(path).query).get("device")
+    return set(devices) if devices else None
+
+def handle_client_message(websocket, message):
+    """Clients can change subscriptions with {"subscribe": ["glove1", ...]}, or null for all,
+    and opt into binary telemetry with {"telemetry": {...}} (see emg_engine.telemetry)"""
+    try:
+        request = json.loads(message)
+        devices = request.get("subscribe", ())
+    except (ValueError, AttributeError):
+        return
+    if "telemetry" in request:
+        telemetry.subscribe(websocket, request["telemetry"])
+    if devices == ():
+        return
+    if isinstance(devices, str):
+        devices = [devices]
+    broadcaster.subscribe(websocket, set(devices) if devices is not None else None)
+
 async def ws_handler(websocket):
-    connected_clients.add(websocket)
-    print("Client connected")
+    from websockets.exceptions import ConnectionClosed
+    broadcaster.register(websocket, requested_devices(websocket))
+    log.info("Client connected")
     try:
-        while True:
-            await asyncio.sleep(1)  # Keep connection alive
-    except websockets.exceptions.ConnectionClosed as e:
-        print(f"Client disconnected: {e.code} - {e.reason}")
+        async for message in websocket:
+            handle_client_message(websocket, message)
+    except ConnectionClosed as e:
+        log.info("Client disconnected: %s - %s", e.code, e.reason)
     finally:
-        connected_clients.remove(websocket)
+        telemetry.unsubscribe(websocket)
+        broadcaster.unregister(websocket)
+
+async def ws_route(request):
+    """The same protocol on the unified server's /ws route."""
+    websocket = web.WebSocketResponse(heartbeat=30)
+    await websocket.prepare(request)
+    devices = request.query.getall("device", None)
+    broadcaster.register(websocket, set(devices) if devices else None, send=lambda message:
+                         websocket.send_bytes(message) if isinstance(message, bytes) else websocket.send_str(message))
+    log.info("Client connected")
+    try:
+        async for message in websocket:
+            if message.type == web.WSMsgType.TEXT:
+                handle_client_message(websocket, message.data)
+    finally:
+        telemetry.unsubscribe(websocket)
+        broadcaster.unregister(websocket)
+        log.info("Client disconnected: %s", websocket.close_code)
+    return websocket
 
-# --- Combined WebSocket Server + Sender Loop ---
+# --- WebSocket Server ---
 def start_websocket(loop_holder, ready_event):
-    async def sender():
-        while True:
-            data = await data_queue.get()
-            if connected_clients:
-                print(f"📤 Sending to {len(connected_clients)} client(s): {data}")
-                tasks = [asyncio.create_task(client.send(data)) for client in connected_clients]
-                await asyncio.gather(*tasks, return_exceptions=True)
+    import websockets
 
     async def run():
         async with websockets.serve(ws_handler, "0.0.0.0", WS_PORT):
-            print(f"✅ WebSocket server running at ws://127.0.0.1:{WS_PORT}")
+            log.info("✅ WebSocket server running at ws://127.0.0.1:%d", WS_PORT)
             loop_holder['loop'] = asyncio.get_running_loop()
             ready_event.set()
+            telemetry_task = asyncio.create_task(telemetry.run())
 
-            # Start sender loop in background
-            asyncio.create_task(sender())
-
-            # Keep the server alive
-            while True:
-                await asyncio.sleep(3600)
+            # Each client is served by its own sender task in the broadcaster
+            await asyncio.Future()
 
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
@@ -94,90 +183,214 @@ def start_websocket(loop_holder, ready_event):
 
 # --- MQTT Callbacks ---
 def on_connect(client, userdata, flags, reason_code, properties):
-    print(f"Connected with result code {reason_code}")
-    client.subscribe(TOPIC)
+    log.info("Connected with result code %s", reason_code)
+    client.subscribe([(TOPIC, 0), (TOPIC + "/+", 0)])
 
-last_prediction_time = 0  # track sliding interval
+samples = SampleQueue(SAMPLE_QUEUE_SIZE, QUEUE_POLICY)
+pool = None  # the InferencePool when INFERENCE_WORKERS > 1, once the model is ready
 
 def on_message(client, userdata, msg):
-    global buffer, last_prediction_time
-    loop = userdata['loop']
-
+    """Runs on the MQTT network thread (the event loop when unified): parse and hand off, nothing else."""
+    received_at = time.perf_counter()
+    METRICS.inc("messages")
     try:
-        payload = msg.payload.decode().strip()
-        payload = payload.replace("{", "").replace("}", "")
-        values = [float(x) for x in payload.split(",")]
-
-        if len(values) != 9:
+        # Binary frames, JSON and the old brace-wrapped CSV all decode to (N, 9) rows
+        device_id, rows = pipeline.parse(msg.topic, msg.payload)
+        if device_id is None:
             return
 
-        timestamp, emg1, emg2, accx, accy, accz, gyrox, gyroy, gyroz = values
-        buffer.append([timestamp, emg1, emg2, accx, accy, accz, gyrox, gyroy, gyroz])
-
-        # Keep only data from the last WINDOW_MS milliseconds
-        min_time = timestamp - MAIN_WINDOW_MS
-        buffer = [row for row in buffer if row[0] >= min_time]
-
-        # Run prediction every OVERLAP_MS
-        if timestamp - last_prediction_time >= OVERLAP_MS:
-            df = pd.DataFrame(buffer, columns=["time","emg1","emg2","accx","accy","accz","gyrox","gyroy","gyroz"])
-            df_window = df[df["time"] >= (timestamp - SUB_WINDOW_MS)]
-            if len(df_window) == 0:
+        if recorder is not None:
+            recorder.add(device_id, rows)
+        if store is not None:
+            store.add_samples(device_id, rows)
+        if telemetry.wants_raw:
+            telemetry.add_samples(device_id, rows)
+        if INFERENCE_WORKERS > 1:
+            if pool is None:
+                # The model is still loading and the workers are not started yet
+                METRICS.inc("pool_not_ready", len(rows))
                 return
-
-            feats = feature_extraction(df_window)
-            if len(feats.columns) == 0:
-                return
-
-            # Get probabilities for each class
-            probs = model.predict_proba(feats.to_numpy())[0]
-            max_prob_index = np.argmax(probs)
-            max_prob = probs[max_prob_index]
-
-            if max_prob >= 0.4:
-                pred = model.classes_[max_prob_index]
-                #print(pred)
-                to_send = {"predicted_label": pred}
-                asyncio.run_coroutine_threadsafe(data_queue.put(json.dumps(to_send)), loop)
-                print(f"🖐 Predicted: {pred} ({max_prob*100:.1f}% confidence)")
-            else:
-                print("❌ Not recognized (confidence below 50%)")
-
-            last_prediction_time = timestamp
+            pool.put(device_id, rows, received_at)
+        else:
+            for values in rows:
+                samples.put((device_id, values, received_at))
+        METRICS.inc("samples", len(rows))
 
     except Exception as e:
-        print("Error:", e)
-
-# Load the pre-trained Random Forest model
-#model_path = os.path.join(os.path.dirname(__file__), r"EMG FINAL\sign-language-translator\websocket_page\random_forest_model_windows.pkl")
-try:
-    model = joblib.load(r"EMG FINAL\sign-language-translator\websocket_page\random_forest_model_windows.pkl")
-    print("Random Forest model loaded successfully.")
-except FileNotFoundError:
-    print(f"Error: Model file '{model}' not found.")
-    exit()
-
-labels = ["thank","help","welcome"]
+        METRICS.inc("parse_errors")
+        log.warning("Dropping malformed payload on %s: %s", msg.topic, e)
+    METRICS.record("mqtt_receive", time.perf_counter() - received_at)
+
+def process_sample(item):
+    """Runs on the inference worker: window update, features and prediction."""
+    device_id, values, received_at = item
+    METRICS.record("ingest_queue", time.perf_counter() - received_at)
+    try:
+        pipeline.process_sample(device_id, values, received_at)
+    except Exception:
+        log.exception("Failed to process sample from %s", device_id)
+
+def publish_prediction(prediction):
+    if store is not None:
+        store.add_prediction(prediction)
+    if telemetry.clients:
+        telemetry.add_prediction(prediction)
+    device_id, pred, max_prob = prediction.device_id, prediction.label, prediction.confidence
+    if pred is not None:
+        METRICS.inc("predictions")
+        if SMOOTHING is not None:
+            # Only whole gestures are published, see publish_gesture
+            log.debug("[%s] Window: %s (%.1f%% confidence)", device_id, pred, max_prob * 100)
+            return
+        to_send = {"predicted_label": pred, "device_id": device_id}
+        # Keyed by device: a client that falls behind only gets the latest prediction
+        websocket_loop.call_soon_threadsafe(broadcaster.publish, device_id, json.dumps(to_send),
+                                            device_id, prediction.received_at)
+        log.info("🖐 [%s] Predicted: %s (%.1f%% confidence)", device_id, pred, max_prob * 100)
+    else:
+        METRICS.inc("low_confidence")
+        log.debug("❌ [%s] Not recognized (%.1f%% confidence)", device_id, max_prob * 100)
+
+def publish_gesture(event):
+    METRICS.inc("gestures")
+    if store is not None:
+        store.add_gesture(event)
+    to_send = {"predicted_label": event.label, "device_id": event.device_id,
+               "start": event.start, "end": event.end, "confidence": round(event.confidence, 3)}
+    websocket_loop.call_soon_threadsafe(broadcaster.publish, event.device_id, json.dumps(to_send))
+    log.info("🖐 [%s] Gesture: %s (%.0f-%.0f ms, %.1f%% confidence)", event.device_id, event.label,
+             event.start, event.end, event.confidence * 100)
+
+# --- Load the pre-trained Random Forest model ---
+model_state = {"status": "loading"}
+
+def load_model():
+    """Load the classifier, preferring the memory-mapped flat forest.
+
+    The flat forest needs neither joblib nor sklearn and its arrays are
+    mapped read-only, so every process serving the model shares the pages.
+    It is flattened again whenever MODEL_PATH changes, e.g. after retraining.
+    Every MODEL_BACKEND goes through backends.load_backend.
+    """
+    started = time.perf_counter()
+    if MODEL_BACKEND == "flat" and FLAT_MODEL_PATH and FlatForestBackend.is_current(FLAT_MODEL_PATH, MODEL_PATH):
+        model = load_backend(FLAT_MODEL_PATH, "flat", mmap_mode="r")
+        source = FLAT_MODEL_PATH
+    else:
+        model = load_backend(MODEL_PATH, MODEL_BACKEND)
+        source = MODEL_PATH
+        if isinstance(model, FlatForestBackend) and FLAT_MODEL_PATH and not os.path.isdir(MODEL_PATH):
+            model.save(FLAT_MODEL_PATH, source=MODEL_PATH)
+            log.info("Saved flat forest to %s for faster starts", FLAT_MODEL_PATH)
+    log.info("Random Forest model loaded from %s (%s) in %.2fs", source, type(model).__name__,
+             time.perf_counter() - started)
+    return model
+
+def install_model():
+    """Load the model into the pipeline; samples are buffered but not classified until then."""
+    try:
+        pipeline.model = load_model()
+        telemetry.labels = [str(label) for label in pipeline.model.classes_]
+    except FileNotFoundError as e:
+        log.error("Model file not found: %s", e.filename)
+        model_state.update(status="failed", error=f"Model file not found: {e.filename}")
+        return False
+    model_state.update(status="ready", ready_after_s=time.perf_counter() - STARTED_AT)
+    log.info("Ready %.2fs after start", model_state["ready_after_s"])
+    return True
+
+def start_pool():
+    """Load the model here (writing the flat forest the workers map), then start the workers."""
+    global pool
+    if not install_model():
+        return False
+    inference_pool = InferencePool(INFERENCE_WORKERS, make_pipeline, load_model,
+                                   on_prediction=publish_prediction, on_gesture=publish_gesture,
+                                   ring_size=POOL_RING_SIZE, row_width=1 + len(SENSORS), timings=METRICS,
+                                   idle_timeout_s=IDLE_SESSION_S)
+    inference_pool.start()
+    METRICS.gauge("pool_queue", inference_pool.queued)
+    METRICS.gauge("pool_dropped", lambda: inference_pool.dropped)
+    METRICS.gauge("pool_processed", inference_pool.processed)
+    pool = inference_pool
+    log.info("Sharding gloves across %d inference processes", INFERENCE_WORKERS)
+    return True
+
+def make_pipeline(on_prediction=None, on_gesture=None, timings=None):
+    """The inference pipeline with these settings; one per inference process."""
+    return build_pipeline(CONFIG, on_prediction, on_gesture, timings)
+
+pipeline = make_pipeline(publish_prediction, publish_gesture, METRICS)
+
+def pipeline_stats():
+    """The pipeline counters: this process's, or the inference processes' summed in pool mode."""
+    return pool.pipeline_stats() if pool is not None else pipeline.stats()
+
+def stat_gauge(name, per=None):
+    """A gauge reading one pipeline counter, or its ratio to another."""
+    def read():
+        stats = pipeline_stats()
+        value = stats.get(name, 0)
+        return value if per is None else value / max(stats.get(per, 0), 1)
+    return read
+
+METRICS.gauge("sample_queue", lambda: len(samples))
+METRICS.gauge("dropped_samples", lambda: samples.dropped)
+METRICS.gauge("sessions", stat_gauge("sessions"))
+METRICS.gauge("ws_clients", lambda: len(broadcaster))
+METRICS.gauge("telemetry_clients", lambda: len(telemetry))
+METRICS.gauge("telemetry_frames", lambda: telemetry.frames)
+METRICS.gauge("telemetry_bytes", lambda: telemetry.bytes)
+METRICS.gauge("gated_fraction", stat_gauge("samples_gated", per="samples_seen"))
+for event in (DUPLICATE, OUT_OF_ORDER, GAP, RESTART):
+    METRICS.gauge(f"stream_{event}", stat_gauge(f"stream_{event}"))
+METRICS.gauge("seq_lost", stat_gauge("seq_lost"))
+METRICS.gauge("seq_reordered", stat_gauge("seq_reordered"))
+if pipeline.scheduler is not None:
+    METRICS.gauge("batch_mean_size", stat_gauge("batch_rows", per="batches"))
+    METRICS.gauge("batch_full_fraction", stat_gauge("full_batches", per="batches"))
 
 # --- Feature Extraction Logic ---
 def feature_extraction(df_window):
-    """Compute same features used during training"""
+    """Compute same features used during training, in the configured SENSORS and FEATURES order"""
     feats = {}
-    sensors = ["emg1", "emg2", "accx", "accy", "accz", "gyrox", "gyroy", "gyroz"]
-    for s in sensors:
+    for s in SENSORS:
         data = df_window[s].values
         if len(data) == 0:
             continue
-        feats[f"{s}_mav"] = np.mean(np.abs(data))
-        feats[f"{s}_rms"] = np.sqrt(np.mean(np.square(data)))
-        feats[f"{s}_var"] = np.var(data)
-        feats[f"{s}_zc"] = np.sum(np.diff(np.sign(data)) != 0)
-        feats[f"{s}_wl"] = np.sum(np.abs(np.diff(data)))
-        feats[f"{s}_iemg"] = np.sum(np.abs(data))
+        computed = {
+            "mav": np.mean(np.abs(data)),
+            "rms": np.sqrt(np.mean(np.square(data))),
+            "var": np.var(data),
+            "zc": np.sum(np.diff(np.sign(data)) != 0),
+            "wl": np.sum(np.abs(np.diff(data))),
+            "iemg": np.sum(np.abs(data)),
+        }
+        for f in FEATURES:
+            feats[f"{s}_{f}"] = computed[f]
+    import pandas as pd
     return pd.DataFrame([feats])
 
-def process_buffer(df):
-    """Split 4s buffer into 500ms subwindows with 250ms overlap and predict."""
+def process_buffer(df, batched=True):
+    """Split 4s buffer into 500ms subwindows with 250ms overlap and predict.
+
+    Returns (start, end, label, confidence) for every non-empty subwindow. The
+    batched path builds all feature rows at once and calls predict_proba once.
+    """
+    model = pipeline.model
+    step = SUB_WINDOW_MS - OVERLAP_MS
+    results = []
+
+    if batched:
+        df = df.sort_values("time")
+        starts, preds, confs = predict_windows(model, df["time"].to_numpy(), df[SENSORS].to_numpy(),
+                                               SUB_WINDOW_MS, step, FEATURES)
+        for current_start, pred, conf in zip(starts, preds, confs):
+            current_end = current_start + SUB_WINDOW_MS
+            log.info("🖐 Predicted gesture (%.0f-%.0f ms): %s", current_start, current_end, pred)
+            results.append((current_start, current_end, pred, conf))
+        return results
+
     start = df["time"].min()
     end = df["time"].max()
 
@@ -188,38 +401,118 @@ def process_buffer(df):
 
         if len(df_window) > 0:
             feats = feature_extraction(df_window)
-            print("Extracted features:", feats)
+            log.debug("Extracted features: %s", feats)
             if len(feats.columns) > 0:
-                pred = model.predict(feats.to_numpy())[0]
-                print(f"🖐 Predicted gesture ({current_start:.0f}-{current_end:.0f} ms): {pred}")
+                probs = model.predict_proba(feats.to_numpy())[0]
+                pred = model.classes_[np.argmax(probs)]
+                log.info("🖐 Predicted gesture (%.0f-%.0f ms): %s", current_start, current_end, pred)
+                results.append((current_start, current_end, pred, probs.max()))
 
-        current_start += (SUB_WINDOW_MS - OVERLAP_MS)
+        current_start += step
+
+    return results
 
 # --- Start MQTT Client ---
-def start_mqtt_client(loop):
+def create_mqtt_client(loop):
+    import paho.mqtt.client as mqtt
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
     client.user_data_set({'loop': loop})
     client.on_connect = on_connect
     client.on_message = on_message
+    return client
+
+def start_mqtt_client(loop):
+    client = create_mqtt_client(loop)
     
     try:
-        client.connect(MQTT_BROKER, 1883, 60)
+        client.connect(MQTT_BROKER, MQTT_PORT, 60)
         client.loop_forever()
     except Exception as e:
-        print(f"MQTT connection error: {e}")
+        log.error("MQTT connection error: %s", e)
+
+# --- Unified server lifecycle ---
+async def start_background(app):
+    global websocket_loop
+    websocket_loop = asyncio.get_running_loop()
+    model_state["serving_after_s"] = time.perf_counter() - STARTED_AT
+    log.info("Opening port %d %.2fs after start", PORT, model_state["serving_after_s"])
+    # The ports are already open; the model loads while /healthz reports 503
+    if INFERENCE_WORKERS > 1:
+        app['model_loader'] = websocket_loop.run_in_executor(None, start_pool)
+    else:
+        app['model_loader'] = websocket_loop.run_in_executor(None, install_model)
+        app['worker'] = InferenceWorker(samples, process_sample, tick=pipeline.poll)
+        app['worker'].start()
+    from emg_engine.mqtt import AsyncioMqtt
+    app['mqtt'] = AsyncioMqtt(create_mqtt_client(websocket_loop))
+    app['mqtt_task'] = asyncio.create_task(app['mqtt'].run(MQTT_BROKER, MQTT_PORT, 60))
+    app['telemetry'] = asyncio.create_task(telemetry.run())
+
+async def close_clients(app):
+    for websocket in list(broadcaster.clients):
+        await websocket.close(code=1001, message=b"Server shutdown")
+
+async def stop_background(app):
+    # Stop taking samples first, then let the worker finish what it has
+    await app['mqtt'].stop()
+    app['mqtt_task'].cancel()
+    app['telemetry'].cancel()
+    if 'worker' in app:
+        worker = app['worker']
+        worker.stop(drain_s=5)
+        await websocket_loop.run_in_executor(None, worker.join, 6)
+        if not worker.is_alive():
+            pipeline.flush()  # windows still waiting for a batch
+        if len(samples):
+            log.warning("Shutting down with %d samples not classified", len(samples))
+    await app['model_loader']
+    if pool is not None:
+        await websocket_loop.run_in_executor(None, pool.stop)
+
+def open_store():
+    global store
+    store = SessionStore(STORE_DIR, roll_bytes=STORE_ROLL_MB << 20, roll_s=STORE_ROLL_S)
+    METRICS.gauge("store_pending", lambda: len(store))
+    METRICS.gauge("store_dropped", lambda: store.dropped)
+    log.info("Storing samples and predictions under %s", STORE_DIR)
 
 # --- Boot Everything ---
-if __name__ == "__main__":
-    # Start the web server
-    threading.Thread(target=start_http_server, daemon=True).start()
-
-    # Start WebSocket server and share event loop with MQTT client
-    loop_ready = threading.Event()
-    loop_holder = {}
-    threading.Thread(target=start_websocket, args=(loop_holder, loop_ready), daemon=True).start()
-
-    loop_ready.wait()  # Wait until WebSocket loop is ready
-    websocket_loop = loop_holder['loop']
+def main():
+    global websocket_loop
+    try:
+        if STORE_DIR:
+            open_store()
+        if UNIFIED_SERVER:
+            # HTTP, /ws and MQTT share one event loop; only inference has its own thread
+            web.run_app(create_web_app(unified=True), port=PORT)
+        else:
+            if not (start_pool() if INFERENCE_WORKERS > 1 else install_model()):
+                exit()
+
+            # Start the web server
+            threading.Thread(target=start_http_server, daemon=True).start()
+
+            # Start WebSocket server and share event loop with MQTT client
+            loop_ready = threading.Event()
+            loop_holder = {}
+            threading.Thread(target=start_websocket, args=(loop_holder, loop_ready), daemon=True).start()
+
+            loop_ready.wait()  # Wait until WebSocket loop is ready
+            websocket_loop = loop_holder['loop']
+
+            # Start the inference worker that drains the MQTT sample queue
+            if INFERENCE_WORKERS == 1:
+                worker = InferenceWorker(samples, process_sample, tick=pipeline.poll)
+                worker.start()
+
+            # Start MQTT client
+            start_mqtt_client(websocket_loop)
+    finally:
+        if recorder is not None:
+            log.info("Saved %d samples to %s", len(recorder), recorder.save())
+        if store is not None:
+            store.close()
+            log.info("Stored %d records in %s", store.written, STORE_DIR)
 
-    # Start MQTT client
-    start_mqtt_client(websocket_loop)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,38 @@
+"""The engine must classify a short synthetic session exactly as the old app code did."""
+import pytest
+
+pytest.importorskip("sklearn")
+
+from emg_engine.bench import synthetic_model
+from emg_engine.config import load_config
+from emg_engine.parity import _single_model, check_glove, check_single, compare
+from emg_engine.recording import synthetic_recording
+
+
+@pytest.fixture(scope="module")
+def recording():
+    return synthetic_recording(10, 100, 2)
+
+
+@pytest.mark.parametrize("backend", ["flat", "sklearn"])
+def test_single_matches_legacy(recording, backend):
+    model = _single_model(recording, load_config("single", environ={})["FEATURES"])
+    expected, got = check_single(model, recording, environ={"EMG_MODEL_BACKEND": backend})
+    assert expected
+    assert compare(expected, got) == []
+
+
+@pytest.mark.parametrize("backend", ["flat", "sklearn"])
+def test_glove_matches_legacy(recording, backend):
+    pytest.importorskip("pandas")
+    model = synthetic_model(recording, n_estimators=10)
+    expected, got = check_glove(model, recording, environ={"EMG_MODEL_BACKEND": backend})
+    assert expected
+    assert compare(expected, got) == []
+
+
+def test_compare_reports_mismatches():
+    expected = {("glove0", 250.0): "peace", ("glove0", 500.0): "rock"}
+    got = {("glove0", 250.0): "peace", ("glove0", 500.0): "thumbs", ("glove0", 750.0): "rock"}
+    assert compare(expected, got) == [(("glove0", 500.0), "rock", "thumbs"),
+                                      (("glove0", 750.0), "<none>", "rock")]
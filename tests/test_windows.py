@@ -0,0 +1,61 @@
+"""Streaming features, incremental or not, must cover the same samples as training's windows."""
+import numpy as np
+import pytest
+
+from emg_engine.batch import window_features_batch
+from emg_engine.config import build_pipeline, load_config
+from emg_engine.recording import synthetic_recording
+from emg_engine.resample import StreamResampler
+
+
+class _Constant:
+    """Stands in for the model: every window gets the same label."""
+
+    classes_ = np.array(["rest"])
+
+    def predict_proba(self, X):
+        return np.ones((len(X), 1))
+
+
+def _stream_features(recording, incremental):
+    config = load_config("glove", environ={"EMG_INCREMENTAL_FEATURES": str(incremental).lower(),
+                                           "EMG_REST_GATING": "false", "EMG_SMOOTHING": "null",
+                                           "EMG_BATCH_DEADLINE_MS": "null"})
+    got = {}
+    pipeline = build_pipeline(config, on_prediction=lambda p: got.__setitem__(p.timestamp, p.features))
+    pipeline.model = _Constant()
+    first = recording.device == 0
+    for row in recording.samples[first]:
+        pipeline.process_sample("glove0", row)
+    return config, got
+
+
+@pytest.fixture(scope="module")
+def recording():
+    return synthetic_recording(10, 100, 1)
+
+
+def test_incremental_matches_recomputed(recording):
+    _, incremental = _stream_features(recording, True)
+    _, recomputed = _stream_features(recording, False)
+    assert incremental.keys() == recomputed.keys()
+    for timestamp in incremental:
+        np.testing.assert_allclose(incremental[timestamp], recomputed[timestamp], rtol=1e-4, atol=1e-3)
+
+
+def test_stream_windows_match_training(recording):
+    config, streamed = _stream_features(recording, False)
+    resampler = StreamResampler(config["SAMPLE_RATE"], config["MAX_GAP_MS"])
+    grid = [resampler.add(row[0], row[1:])[1:] for row in recording.samples[recording.device == 0]]
+    times = np.concatenate([t for t, _ in grid])
+    values = np.concatenate([v for _, v in grid]).astype(np.float32)
+    window = config["SUB_WINDOW_MS"]
+    starts, X = window_features_batch(times, values, window, 1000 / config["SAMPLE_RATE"])
+    # A streamed window ending at t covers (t - window, t], the training window starting one step later
+    trained = dict(zip((starts + window - 1000 / config["SAMPLE_RATE"]).round(6), X))
+    matched = 0
+    for timestamp, features in streamed.items():
+        if round(timestamp, 6) in trained and timestamp - times[0] >= window:
+            np.testing.assert_allclose(features, trained[round(timestamp, 6)], rtol=1e-4, atol=1e-3)
+            matched += 1
+    assert matched > 10